@@ -1,9 +1,12 @@
 #!/usr/bin/python
 # CinemaApp
 
+import time
+STARTED = time.perf_counter()  #отсчет времени запуска приложения
 from PyQt5 import QtCore, QtWidgets, QtGui, QtPrintSupport 
-import sys, os, datetime, sqlite3, time, random
+import sys, os, datetime
 import dbworks as dbw
+import dbserver
 
 DEF_WINDOW_WI = 1024 #Ширина окна по умолчанию
 DEF_WINDOW_HI = 768  #Высота окна по умолчанию
@@ -13,7 +16,6 @@ DIAG_V_SPACING = 50
 DIAG_H_SPACING = 100
 DIAG_ELEMENT_MIN_WI = 10
 DIAG_ELEMENT_MIN_HI = 1
-MAX_SEATS_PER_DAY = 400
 AXIS_Y_SPACING = 50
 AXIS_Y_STEP = 100
 WHITE = QtCore.Qt.white
@@ -24,6 +26,8 @@ CYAN = QtCore.Qt.cyan
 PARAMS = "OperatorName", "TicketPrice"
 INIFILE = "CinemaApp.ini"
 FILENAME = "CinemaDB.db"
+HOLD_TIMER = 1000  #период проверки просроченной брони, мс
+HALLFILE = "CinemaHall.txt"  #схема зала, если файла нет - берется схема из БД
 TODAY = datetime.date.today()
 ICONS = {"main": "./icons/film_reel.png",
          "ok": "./icons/ok.png",
@@ -40,18 +44,38 @@ class CinemaApp(QtWidgets.QMainWindow):
     """
     Класс главного окна приложения
     """
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, server=None):
         """
-        При создании нового экземпляра класса выполняется создание интерфейса
+        При создании нового экземпляра класса выполняется создание интерфейса.
+        server - адрес "хост:порт" сервера продажи билетов, если задан, продажа,
+        возврат, бронь, занятость мест и регистрация дня идут через сервер,
+        а файл БД приложение только читает (кроме обновления схемы БД).
+        Окно сразу показывает заготовку зала, подключение к БД и загрузка
+        занятости идут в фоновом потоке StartupThread.
         """
         QtWidgets.QWidget.__init__(self, parent)
         self.FIO, self.TICKET_PRICE = self.readParametersFromFile(INIFILE)
         self.filename = FILENAME
-        self.db = dbw.connect_DB(self.filename)
-        dbw.new_day(str(TODAY), self.TICKET_PRICE, self.db)
+        self.connections = dbw.ConnectionManager(self.filename)
+        self.db = None  #до окончания загрузки БД нет
+        self.seats = self.holds = self.popularity = None
+        self.hall = self.placeholderHall(HALLFILE)
+        self.tracer = None  #статистика последней трассировки
+        self.startupTimes = {}  #время этапов запуска от старта процесса, с
+        self.exitAfterStartup = False  #вывести время запуска и выйти
         self.initUI()        
-        self.statusBar().showMessage("Добро пожаловать! Текущее время: " + \
-                                     str(datetime.datetime.now().time()))
+        self.holdTimer = QtCore.QTimer(self)  #снятие просроченной брони
+        self.holdTimer.timeout.connect(self.onHoldTimer)
+        self.progressBar = QtWidgets.QProgressBar()
+        self.progressBar.setMaximumWidth(200)
+        self.statusBar().addPermanentWidget(self.progressBar)
+        self.statusBar().showMessage("Загрузка...")
+        self.startup = StartupThread(self.connections, self.TICKET_PRICE, server, parent=self)
+        self.startup.progress.connect(self.onStartupProgress)
+        self.startup.loaded.connect(self.onStartupLoaded)
+        self.startup.failed.connect(self.onStartupFailed)
+        self.startup.start()
+        QtCore.QTimer.singleShot(0, lambda: self.markStartup("window"))
         
         
     def initUI(self):
@@ -88,6 +112,15 @@ class CinemaApp(QtWidgets.QMainWindow):
         aboutQtAction.setStatusTip("Информация о Qt5.")
         aboutQtAction.triggered.connect(QtWidgets.QApplication.instance().aboutQt)
 
+        self.traceAction = QtWidgets.QAction("Трассировка запросов", self)
+        self.traceAction.setCheckable(True)
+        self.traceAction.setStatusTip("Сбор статистики запросов к БД и времени работы функций.")
+        self.traceAction.toggled.connect(self.onTraceToggled)
+
+        diagnosticsAction = QtWidgets.QAction("Диагностика...", self)
+        diagnosticsAction.setStatusTip("Статистика трассировки запросов.")
+        diagnosticsAction.triggered.connect(self.openDiagnosticsWindow)
+
         #Главное меню приложения :
         mainMenu = self.menuBar()
         fileMenu = mainMenu.addMenu("Файл")
@@ -95,6 +128,9 @@ class CinemaApp(QtWidgets.QMainWindow):
         fileMenu.addAction(exitAction)
         servisMenu = mainMenu.addMenu("Сервис")
         servisMenu.addAction(setupAction)
+        servisMenu.addSeparator()
+        servisMenu.addAction(self.traceAction)
+        servisMenu.addAction(diagnosticsAction)
         helpMenu = mainMenu.addMenu("Справка")
         helpMenu.addAction(aboutAction)
         helpMenu.addAction(aboutQtAction)
@@ -105,11 +141,8 @@ class CinemaApp(QtWidgets.QMainWindow):
         self.operatorLabel = QtWidgets.QLabel("{0:>25} {1:<25}".format("Фамилия оператора :", self.FIO))
         self.ticketLabel = QtWidgets.QLabel("{0:>25} {1:<5}".format("Цена билета :", self.TICKET_PRICE))
         
-        self.sessionSelector = QtWidgets.QComboBox()
-        self.sessionSelector.addItem("Сеанс 10ч", "Session10")
-        self.sessionSelector.addItem("Сеанс 12ч", "Session12")
-        self.sessionSelector.addItem("Сеанс 14ч", "Session14")
-        self.sessionSelector.addItem("Сеанс 16ч", "Session16")
+        self.sessionSelector = QtWidgets.QComboBox()   #сеансы текущего дня по расписанию
+        self.fillSessions()
         self.sessionSelector.currentIndexChanged.connect(self.onSessionChange)
 
         self.dateSelector = QtWidgets.QDateEdit()
@@ -121,8 +154,28 @@ class CinemaApp(QtWidgets.QMainWindow):
         self.todayBtn.setDisabled(True)
         self.todayBtn.clicked.connect(self.onTodayBtnPressed)
 
+        self.sellGroupBtn = QtWidgets.QPushButton("Продать выбранные")  #групповые операции над
+        self.sellGroupBtn.setStatusTip("Места выбираются щелчком с нажатой Ctrl.")  #выбранными местами
+        self.sellGroupBtn.clicked.connect(self.onSellGroupPressed)
+        self.returnGroupBtn = QtWidgets.QPushButton("Вернуть выбранные")
+        self.returnGroupBtn.setStatusTip("Места выбираются щелчком с нажатой Ctrl.")
+        self.returnGroupBtn.clicked.connect(self.onReturnGroupPressed)
+
+        self.heatBtn = QtWidgets.QPushButton("Популярность мест")  #тепловая карта зала
+        self.heatBtn.setCheckable(True)
+        self.heatBtn.setStatusTip("Раскрасить места по частоте продаж на этот сеанс за период.")
+        self.heatBtn.toggled.connect(self.paintHall)
+        self.heatFrom = QtWidgets.QDateEdit()  #период тепловой карты
+        self.heatFrom.setDate(TODAY - datetime.timedelta(30))
+        self.heatFrom.setCalendarPopup(True)
+        self.heatFrom.dateChanged.connect(self.onHeatPeriodChange)
+        self.heatTo = QtWidgets.QDateEdit()
+        self.heatTo.setDate(TODAY)
+        self.heatTo.setCalendarPopup(True)
+        self.heatTo.dateChanged.connect(self.onHeatPeriodChange)
+
         #Панель инструментов :
-        mainBar = self.addToolBar("Стандартные")
+        mainBar = self.mainBar = self.addToolBar("Стандартные")
         mainBar.setFloatable(False)
         mainBar.setMovable(False)
         mainBar.addWidget(sessionLabel)
@@ -132,38 +185,16 @@ class CinemaApp(QtWidgets.QMainWindow):
         mainBar.addWidget(self.todayBtn)
         mainBar.addWidget(self.operatorLabel)
         mainBar.addWidget(self.ticketLabel)
+        mainBar.addWidget(self.sellGroupBtn)
+        mainBar.addWidget(self.returnGroupBtn)
+        mainBar.addWidget(self.heatBtn)
+        mainBar.addWidget(self.heatFrom)
+        mainBar.addWidget(self.heatTo)
 
         #Панель с местами :
-        frameHall = QtWidgets.QWidget()
-        frameHall.layout = QtWidgets.QGridLayout()
-        
-        caption = QtWidgets.QLabel("<center><h1><b>Зал</b></h1></center>")  #Заголовок над кнопками
-        caption.resize(500, 20)
-        caption.setSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
-        frameHall.layout.addWidget(caption, 0, 5)
-       
-        labels = []
-        for i in range(1,11):   #Генерация надписей-имен рядов
-            labelText = "<center><b>{0} {1:>3}</b></center>".format("Ряд",str(i))
-            label = QtWidgets.QLabel(labelText)
-            labels.append(label)
-            frameHall.layout.addWidget(label, i, 0)            
-
-        self.buttons = []
-        for i in range(1,11):   #Генерация кнопок
-            for j in range(1,11):
-                btnText = "{0}.{1:0>2}".format(i,j) #текст на кнопке в формате Р.ММ
-                seatno = i * 100 + j 
-                btn = SeatButton(btnText, seatNo=seatno, parent=self) 
-                if self.checkVacancy(seatno):
-                    btn.setStyleSheet("background-color:rgb(128,255,128)")
-                else:
-                    btn.setStyleSheet("background-color:rgb(255,128,128)")                
-                btn.clicked.connect(self.onSeatBtnPressed)
-                self.buttons.append(btn)
-                frameHall.layout.addWidget(btn, i, j)                
-                
-        frameHall.setLayout(frameHall.layout)
+        self.scrollHall = QtWidgets.QScrollArea()  #большой зал прокручивается
+        self.scrollHall.setWidgetResizable(True)
+        self.makeHall()
 
         #Панель с проданными :
         frameSeats = QtWidgets.QWidget()
@@ -250,7 +281,7 @@ class CinemaApp(QtWidgets.QMainWindow):
 
         #Панель со вкладками : 
         tabNotebook = QtWidgets.QTabWidget(self)
-        tabNotebook.addTab(frameHall, QtGui.QIcon(), "&Места в зале")
+        tabNotebook.addTab(self.scrollHall, QtGui.QIcon(), "&Места в зале")
         tabNotebook.addTab(frameSeats, QtGui.QIcon(), "Отчет по &проданым")
         tabNotebook.addTab(frameSells, QtGui.QIcon(), "Отчет по &выручке")
         tabNotebook.setCurrentIndex(0)
@@ -261,6 +292,145 @@ class CinemaApp(QtWidgets.QMainWindow):
         self.setCentralWidget(QtWidgets.QWidget())
         self.layout = QtWidgets.QHBoxLayout(self.centralWidget())        
         self.layout.addWidget(tabNotebook)
+        self.mainBar.setEnabled(self.db is not None)  #до загрузки БД работать с залом нельзя
+        self.centralWidget().setEnabled(self.db is not None)
+
+    def placeholderHall(self, filename):
+        """
+        Схема зала для заготовки на время загрузки: из файла, если он читается,
+        иначе схема по умолчанию. Настоящая схема берется из БД после загрузки.
+        """
+        try:
+            return dbw.load_hall(filename)
+        except (OSError, ValueError):
+            return dbw.DEFAULT_HALL
+
+    def markStartup(self, stage):
+        """
+        Запоминаем время этапа запуска от старта процесса.
+        """
+        self.startupTimes[stage] = time.perf_counter() - STARTED
+
+    def onStartupProgress(self, percent, text):
+        self.progressBar.setValue(percent)
+        self.statusBar().showMessage(text)
+
+    def onStartupLoaded(self, result):
+        """
+        БД загружена: принимаем подключение и кэши из фонового потока,
+        строим сеансы и зал, включаем управление.
+        """
+        self.db = result["db"]
+        self.seats, self.holds = result["seats"], result["holds"]
+        self.popularity = dbw.PopularityCache(self.db)  #частота продаж мест для тепловой карты
+        if result["hallError"]:
+            errorMsg = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Critical,
+                                             "Ошибка", "Ошибка при чтении схемы зала " + HALLFILE,
+                                             buttons = QtWidgets.QMessageBox.Ok,
+                                             parent=self)
+            errorMsg.exec()
+        self.sessionSelector.blockSignals(True)
+        self.fillSessions()
+        self.sessionSelector.blockSignals(False)
+        self.makeHall()
+        self.mainBar.setEnabled(True)
+        self.centralWidget().setEnabled(True)
+        self.statusBar().removeWidget(self.progressBar)
+        self.holdTimer.start(HOLD_TIMER)
+        QtCore.QTimer.singleShot(0, self.onFirstInteractiveFrame)
+
+    def onFirstInteractiveFrame(self):
+        """
+        Первый кадр с рабочим залом отрисован - запуск окончен.
+        """
+        self.markStartup("interactive")
+        if self.exitAfterStartup:
+            print(" ".join("{0}={1:.3f}s".format(stage, seconds)
+                           for stage, seconds in self.startupTimes.items()))
+            QtWidgets.qApp.quit()
+            return
+        self.statusBar().showMessage("Добро пожаловать! Окно за {0:.2f} с, готово к работе за {1:.2f} с. "
+                                     "Текущее время: {2}".format(self.startupTimes.get("window", 0),
+                                                                 self.startupTimes["interactive"],
+                                                                 datetime.datetime.now().time()))
+
+    def onStartupFailed(self, text):
+        self.statusBar().removeWidget(self.progressBar)
+        self.statusBar().showMessage("Ошибка загрузки")
+        errorMsg = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Critical,
+                                         "Ошибка", "Ошибка при загрузке базы данных:\n" + text,
+                                         buttons = QtWidgets.QMessageBox.Ok,
+                                         parent=self)
+        errorMsg.exec()
+
+    def makeHall(self):
+        """
+        Создаем панель с кнопками мест по схеме зала выбранного сеанса
+        и помещаем ее в область прокрутки вместо прежней.
+        """
+        self.hallNo = self.currentHall()
+        if self.db is not None:
+            self.hall = dbw.get_hall(self.db, self.hallNo)
+        hall = self.hall
+        frameHall = QtWidgets.QWidget()
+        frameHall.layout = QtWidgets.QGridLayout()
+        
+        caption = QtWidgets.QLabel("<center><h1><b>Зал {0}</b></h1></center>".format(self.hallNo))  #Заголовок над кнопками
+        caption.resize(500, 20)
+        caption.setSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
+        frameHall.layout.addWidget(caption, 0, 1, 1, max(hall.width, 1), QtCore.Qt.AlignCenter)
+       
+        labels = []
+        for i in range(1, len(hall.rows)+1):   #Генерация надписей-имен рядов
+            labelText = "<center><b>{0} {1:>3}</b></center>".format("Ряд",str(i))
+            label = QtWidgets.QLabel(labelText)
+            labels.append(label)
+            frameHall.layout.addWidget(label, i, 0)            
+
+        self.buttons = []
+        self.selected = set()  #места, выбранные для групповой продажи / возврата
+        for k in range(len(hall)):   #Генерация кнопок по схеме зала
+            btnText = "{0}.{1:0>2}".format(hall.row[k], hall.number[k]) #текст на кнопке в формате Р.ММ
+            btn = SeatButton(btnText, seatNo=hall.seats[k], parent=self) 
+            btn.clicked.connect(self.onSeatBtnPressed)
+            btn.setEnabled(self.db is not None)  #заготовка зала до загрузки БД
+            self.buttons.append(btn)
+            frameHall.layout.addWidget(btn, hall.row[k], hall.column[k]+1)                
+        if self.db is not None:
+            self.paintHall()
+                
+        frameHall.setLayout(frameHall.layout)
+        self.scrollHall.setWidget(frameHall)
+
+    def fillSessions(self):
+        """
+        Заполняем список сеансов расписанием на сегодня, выбираем ближайший
+        сеанс, на который еще идет продажа.
+        """
+        now = datetime.datetime.now()
+        self.sessionSelector.clear()
+        if self.db is None:
+            return
+        for show, hall, start, duration, film in dbw.shows(TODAY, self.db):
+            text = "Зал {0} {1} {2}".format(hall, start, film or "")
+            self.sessionSelector.addItem(text.strip(), show)
+        sellable = dbw.sellable_shows(now, self.db)
+        if sellable:
+            self.sessionSelector.setCurrentIndex(self.sessionSelector.findData(sellable[0][0]))
+
+    def currentShow(self):
+        """
+        Возвращает номер выбранного сеанса или None, если сеансов на сегодня нет.
+        """
+        return self.sessionSelector.itemData(self.sessionSelector.currentIndex())
+
+    def currentHall(self):
+        """
+        Возвращает номер зала выбранного сеанса.
+        """
+        show = self.currentShow()
+        record = dbw.get_show(show, self.db) if show is not None else None
+        return record[2] if record is not None else 1
 
     def openSetupWindow(self):
         setupWindow = SetupWindow(parent=self)
@@ -277,6 +447,22 @@ class CinemaApp(QtWidgets.QMainWindow):
         else:
             self.statusBar().showMessage("Настройки не сохранены")
 
+    def onTraceToggled(self, checked):
+        """
+        Включение и выключение трассировки, собранная статистика остается
+        доступной в окне диагностики до следующего включения.
+        """
+        if checked:
+            self.tracer = dbw.enable_tracing(*[db for db in (self.db,) if db is not None])
+            self.statusBar().showMessage("Трассировка включена")
+        else:
+            dbw.disable_tracing()
+            self.statusBar().showMessage("Трассировка выключена")
+
+    def openDiagnosticsWindow(self):
+        diagnosticsWindow = DiagnosticsWindow(tracer=self.tracer, parent=self)
+        diagnosticsWindow.exec()
+
     def openAboutWindow(self):
         aboutMsg = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Information,
                                          "О приложении",
@@ -314,15 +500,19 @@ class CinemaApp(QtWidgets.QMainWindow):
     def onSeatBtnPressed(self):
         """
         При нажатии на кнопку места показываем окошко с действиями над местом.
+        Нажатие с Ctrl выбирает место для групповой операции или снимает выбор.
         """
         sender = self.sender()
-        currentSession = self.sessionSelector.currentIndex()
-        sessionName = self.sessionSelector.itemData(currentSession)
+        if QtWidgets.QApplication.keyboardModifiers() & QtCore.Qt.ControlModifier:
+            self.selected ^= {sender.seatNo}
+            self.paintHall()
+            return
         seatEditWindow = SeatEditWindow(parent=sender,
                                         seatNo=sender.seatNo,
-                                        session=sessionName,
+                                        show=self.currentShow(),
                                         price=self.TICKET_PRICE,
-                                        db=self.db)
+                                        db=self.db,
+                                        seats=self.seats)
         seatEditWindow.exec()
 
     def onRefreshSeatsPressed(self):
@@ -342,6 +532,8 @@ class CinemaApp(QtWidgets.QMainWindow):
                                                parent=self)
             nothingMsg.exec()
             return
+        self.setReportHeaders(self.seatsTable, date,
+                              ["Всего продано за день", "% проданых за день"])
         item = QtWidgets.QTableWidgetItem(str(date))
         self.seatsTable.setItem(0, 0, item)        
         for i in range(len(report)):
@@ -362,12 +554,27 @@ class CinemaApp(QtWidgets.QMainWindow):
                                                parent=self)
             nothingMsg.exec()
             return
+        self.setReportHeaders(self.sellsTable, date, ["Всего выручка за день"])
         item = QtWidgets.QTableWidgetItem(str(date))
         self.sellsTable.setItem(0, 0, item)        
         for i in range(len(report)):
             item = QtWidgets.QTableWidgetItem(str(report[i]))
             self.sellsTable.setItem(0, i+1, item)
 
+    def setReportHeaders(self, table, date, totals):
+        """
+        Заголовки колонок таблицы отчета по расписанию на дату:
+        дата, по колонке на каждый сеанс, итоги.
+        """
+        headers = ["Дата"] + ["Зал {0} {1}".format(hall, start)
+                              for show, hall, start, duration, film in dbw.shows(date, self.db)] + totals
+        table.setColumnCount(len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        for i in range(len(headers)):
+            table.horizontalHeaderItem(i).setToolTip(headers[i])
+            table.horizontalHeaderItem(i).setTextAlignment(QtCore.Qt.AlignHCenter)
+        table.resizeColumnsToContents()
+
     def onSeatsDiagrPressed(self):
         seatsDiagr = SeatsGraph(db=self.db, parent=self)
         seatsDiagr.exec()
@@ -456,35 +663,142 @@ class CinemaApp(QtWidgets.QMainWindow):
         """
         Проверка занятости места
         """
-        currentIndex = self.sessionSelector.currentIndex()
-        session = self.sessionSelector.itemData(currentIndex)
-        date = TODAY
-        db = self.db
-        if dbw.isVacancy(seatNo, session, date, db):
+        if self.seats.isVacancy(seatNo, self.currentShow()):
             return False
         return True
 
-    def onSessionChange(self):
+    def paintHall(self):
+        """
+        Раскрашиваем кнопки мест по карте занятости текущего сеанса,
+        карта берется из кэша занятости или загружается из БД одним запросом.
+        """
+        with dbw.timing("CinemaApp.paintHall"):  #время перерисовки в статистике трассировки
+            if self.heatBtn.isChecked():
+                self.paintHeatmap()
+                return
+            show = self.currentShow()
+            sold = self.seats.occupancy(show) if show is not None else set()
+            held = dbw.holds(show, self.db) if show is not None else {}
+            for btn in self.buttons:
+                if btn.seatNo in sold:
+                    style = "background-color:rgb(255,128,128)"
+                elif btn.seatNo in held:
+                    style = "background-color:rgb(255,255,128)"
+                else:
+                    style = "background-color:rgb(128,255,128)"
+                if btn.seatNo in self.selected:
+                    style += "; border:3px solid rgb(0,0,255)"
+                btn.setStyleSheet(style)
+                btn.setToolTip("")
+
+    def paintHeatmap(self):
         """
-        При смене сеанса в выпадающем списке, обновляем цвета кнопок.
+        Тепловая карта: раскрашиваем кнопки мест по доле сеансов периода
+        с тем же временем начала, на которые место было продано,
+        от синего (не продается) до красного (продается всегда).
+        Частота берется из кэша популярности, запрос к БД - только при промахе.
         """
+        show = self.currentShow()
+        record = dbw.get_show(show, self.db) if show is not None else None
+        begin = record[3] if record else None
+        counts, shows = self.popularity.get(self.heatFrom.date().toPyDate(),
+                                            self.heatTo.date().toPyDate(),
+                                            self.hallNo, begin)
         for btn in self.buttons:
-            if self.checkVacancy(btn.seatNo):
-                btn.setStyleSheet("background-color:rgb(128,255,128)")
-            else:
-                btn.setStyleSheet("background-color:rgb(255,128,128)")
+            rate = counts[btn.seatNo] / shows if shows else 0
+            style = "background-color:rgb({0},64,{1})".format(int(255 * rate),
+                                                              int(255 * (1 - rate)))
+            if btn.seatNo in self.selected:
+                style += "; border:3px solid rgb(0,0,255)"
+            btn.setStyleSheet(style)
+            btn.setToolTip("Продано на {0:.0%} сеансов".format(rate))
+
+    def onHeatPeriodChange(self):
+        """
+        При смене периода перекрашиваем зал, если включена тепловая карта.
+        """
+        if self.heatBtn.isChecked():
+            self.paintHall()
 
-    def load_data(self, sp):
+    def onSeatsChanged(self, seats, show, delta):
         """
-        Имитация загрузки приложения
+        Продажа (delta=1) или возврат (delta=-1) мест: вносим их в кэш
+        популярности, в режиме тепловой карты перекрашиваем зал.
         """
-        for i in range(1,11):
-            time.sleep(2)
-            sp.showMessage("Загрузка данных... {0}%".format(i*10),
-                           QtCore.Qt.AlignHCenter | QtCore.Qt.AlignBottom,
-                           QtCore.Qt.black)
-            QtWidgets.qApp.processEvents()
+        self.popularity.update(seats, show, delta)
+        if self.heatBtn.isChecked():
+            self.paintHall()
 
+    def onHoldTimer(self):
+        """
+        По таймеру снимаем просроченную бронь, если освободились места
+        текущего сеанса - перекрашиваем зал.
+        """
+        if self.holds.next_expiry() is None or self.holds.next_expiry() > time.time():
+            return
+        if self.currentShow() in self.holds.reclaim():
+            self.paintHall()
+
+    def onSellGroupPressed(self):
+        """
+        Групповая продажа выбранных мест: все места продаются одной транзакцией,
+        если хоть одно уже продано - не продается ни одно.
+        """
+        self.groupOperation(lambda seats, show:
+                            self.seats.sell_seats(seats, show, int(self.TICKET_PRICE),
+                                                  operator=self.FIO),
+                            "Продажа", "Продано мест: {0}.",
+                            "Часть выбранных мест уже продана, билеты не проданы.", 1)
+
+    def onReturnGroupPressed(self):
+        """
+        Групповой возврат выбранных мест одной транзакцией.
+        """
+        self.groupOperation(self.seats.return_seats,
+                            "Возврат", "Возвращено мест: {0}.",
+                            "Часть выбранных мест не продана, билеты не возвращены.", -1)
+
+    def groupOperation(self, operation, title, doneText, failText, delta):
+        """
+        Выполняем групповую операцию над выбранными местами текущего сеанса
+        и показываем результат. delta - изменение числа продаж места (1 или -1).
+        """
+        show = self.currentShow()
+        if not self.selected:
+            self.statusBar().showMessage("Выберите места щелчком с нажатой Ctrl")
+            return
+        if show is None or not dbw.is_sellable(show, datetime.datetime.now(), self.db):
+            wrongTimeMSG = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Critical,
+                                                 "Неверный сеанс",
+                                                 "Время текущего сеанса истекло,\nВыберите более поздний сеанс.",
+                                                 buttons = QtWidgets.QMessageBox.Ok,
+                                                 parent=self)
+            wrongTimeMSG.exec()
+            return
+        seats = sorted(self.selected)
+        if operation(seats, show):
+            icon, text = QtWidgets.QMessageBox.Information, doneText.format(len(seats))
+            self.selected = set()
+            self.onSeatsChanged(seats, show, delta)
+            if not self.heatBtn.isChecked():  #тепловую карту уже перекрасил onSeatsChanged
+                self.paintHall()
+        else:
+            icon, text = QtWidgets.QMessageBox.Warning, failText
+            self.paintHall()
+        resultMsg = QtWidgets.QMessageBox(icon, title, text,
+                                          buttons = QtWidgets.QMessageBox.Ok,
+                                          parent=self)
+        resultMsg.exec()
+
+    def onSessionChange(self):
+        """
+        При смене сеанса в выпадающем списке, обновляем цвета кнопок,
+        если сеанс идет в другом зале - перестраиваем панель с местами.
+        """
+        if self.currentHall() != self.hallNo:
+            self.makeHall()
+        else:
+            self.paintHall()
 
     def closeEvent(self, e):
         """
@@ -497,14 +811,69 @@ class CinemaApp(QtWidgets.QMainWindow):
                                                  QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No)
         
         if respond == QtWidgets.QMessageBox.Yes:
+            if isinstance(self.seats, dbserver.BookingClient):
+                self.seats.close()
             if self.db is not None:
-                self.db.close()
+                self.connections.close()
             e.accept()
             QtWidgets.QWidget.closeEvent(self,e)
         else:
             e.ignore()
 
 
+class StartupThread(QtCore.QThread):
+    """
+    Фоновая загрузка при запуске: подключение и обновление схемы БД,
+    схема зала, регистрация текущего дня и занятость мест сеансов дня.
+    В режиме клиента сервера день регистрирует сервер, а схема зала из файла
+    в БД не сохраняется - в базу пишет только сервер.
+    Ход загрузки сообщается сигналом progress (проценты, текст этапа),
+    результат - сигналом loaded, ошибка - сигналом failed.
+    """
+    progress = QtCore.pyqtSignal(int, str)
+    loaded = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, connections, price, server=None, parent=None):
+        QtCore.QThread.__init__(self, parent)
+        self.connections = connections
+        self.price = price
+        self.server = server
+
+    def run(self):
+        try:
+            self.progress.emit(5, "Подключение к БД и обновление схемы...")
+            db = self.connections.connection()  #подключение разрешено из любого потока
+            self.progress.emit(40, "Загрузка схемы зала...")
+            hallError = False
+            if not self.server and os.path.exists(HALLFILE):  #схема из файла сохраняется в БД
+                try:
+                    hall = dbw.load_hall(HALLFILE)
+                    if hall.text() != dbw.get_hall(db).text():
+                        dbw.save_hall(hall, db)
+                except (OSError, ValueError):
+                    hallError = True
+            if self.server:
+                self.progress.emit(50, "Подключение к серверу продажи...")
+                host, port = self.server.rsplit(":", 1)
+                seats = holds = dbserver.BookingClient(host, int(port))
+                self.progress.emit(55, "Регистрация текущего дня...")
+                seats.new_day(TODAY, int(self.price))
+            else:
+                self.progress.emit(50, "Регистрация текущего дня...")
+                dbw.new_day(str(TODAY), self.price, db)
+                seats = dbw.OccupancyCache(db, layout=dbw.get_hall(db))
+                holds = dbw.HoldScheduler(db)
+            shows = dbw.shows(TODAY, db)
+            for i, (show, hall, start, duration, film) in enumerate(shows):
+                self.progress.emit(60 + 40 * i // len(shows), "Загрузка занятости сеанса {0}...".format(start))
+                seats.occupancy(show)
+            self.progress.emit(100, "Загрузка окончена")
+            self.loaded.emit({"db": db, "seats": seats, "holds": holds, "hallError": hallError})
+        except Exception as err:  #любая ошибка загрузки - сообщение пользователю, а не вечная "Загрузка..."
+            self.failed.emit("{0}: {1}".format(type(err).__name__, err))
+
+
 class SetupWindow(QtWidgets.QDialog):
     """
     Класс окна настроек приложения 
@@ -595,16 +964,17 @@ class SeatEditWindow(QtWidgets.QDialog):
     """
     Класс окна продажи и возврата билета на указанное место 
     """
-    def __init__(self, parent=None, seatNo=101, session="Session10", price="50", db=None):
+    def __init__(self, parent=None, seatNo=101, show=None, price="50", db=None, seats=None):
         """
         При создании нового экземпляра класса выполняется создание интерфейса окна продажи
         """
         QtWidgets.QWidget.__init__(self, parent)
         self.parent = parent
         self.seatNo = self.parent.seatNo
-        self.session = session        
+        self.show = show
         self.price = int(price)
         self.db = db
+        self.seats = seats
         self.initUI()
         
 
@@ -634,6 +1004,8 @@ class SeatEditWindow(QtWidgets.QDialog):
         self.btnPrint.clicked.connect(self.onPrintPressed)
         self.btnReturn = QtWidgets.QPushButton("Возврат билета")
         self.btnReturn.clicked.connect(self.onReturnPressed)
+        self.btnHold = QtWidgets.QPushButton("Бронь на {0} мин".format(dbw.HOLD_TTL // 60))
+        self.btnHold.clicked.connect(self.onHoldPressed)
         buttonBox = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Close)
         buttonBox.buttons()[0].setText("Закрыть")
         buttonBox.buttons()[0].setIcon(QtGui.QIcon(ICONS["cancel"]))
@@ -643,8 +1015,10 @@ class SeatEditWindow(QtWidgets.QDialog):
             self.btnReturn.setDisabled(True)
             self.btnPrint.setDisabled(True)
             self.btnSell.setEnabled(True)
+            self.btnHold.setEnabled(True)
         else:
             self.btnSell.setDisabled(True)
+            self.btnHold.setDisabled(True)
             self.btnPrint.setEnabled(True)
             self.btnReturn.setEnabled(True)
 
@@ -655,6 +1029,7 @@ class SeatEditWindow(QtWidgets.QDialog):
         self.layout = QtWidgets.QVBoxLayout(self)        
         self.layout.addWidget(headLabel)
         self.layout.addLayout(hbox)
+        self.layout.addWidget(self.btnHold)
         self.layout.addWidget(self.btnReturn)
         self.layout.addWidget(buttonBox)        
         
@@ -674,17 +1049,50 @@ class SeatEditWindow(QtWidgets.QDialog):
         
         sender = self.sender        
         seatNo = self.seatNo
-        session = self.session
-        date = TODAY
+        show = self.show
         price = self.price
-        db = self.db
-        dbw.sell_seat(seatNo, session, date, price, db)
+        if not self.seats.sell_seat(seatNo, show, price, operator=self.parent.parent.FIO):
+            conflictMsg = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Warning,
+                                                "Продажа", "Место уже продано или забронировано другим оператором.",
+                                                buttons = QtWidgets.QMessageBox.Ok,
+                                                parent=self)
+            conflictMsg.exec()
+            self.parent.parent.paintHall()  #место продано или в брони - цвет по БД
+            self.close()
+            return
         sellMsg = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Information,
                                         "Продажа", "Билет успешно продан.",
                                         buttons = QtWidgets.QMessageBox.Ok,
                                         parent=self)
         sellMsg.exec()
         self.parent.setStyleSheet("background-color:rgb(255,128,128)")
+        self.parent.parent.onSeatsChanged([seatNo], show, 1)
+        self.close()
+
+    def onHoldPressed(self):
+        """
+        Временная бронь места, пока покупатель решает.
+        """
+        if self.checkTime():
+            wrongTimeMSG = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Critical,
+                                                 "Неверный сеанс",
+                                                 "Время текущего сеанса истекло,\nВыберите более поздний сеанс.",
+                                                 buttons = QtWidgets.QMessageBox.Ok,
+                                                 parent=self)
+            wrongTimeMSG.exec()
+            return
+
+        main = self.parent.parent
+        if main.holds.hold_seat(self.seatNo, self.show, operator=main.FIO) is None:
+            conflictMsg = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Warning,
+                                                "Бронь", "Место уже продано или забронировано другим оператором.",
+                                                buttons = QtWidgets.QMessageBox.Ok,
+                                                parent=self)
+            conflictMsg.exec()
+            main.paintHall()
+            self.close()
+            return
+        self.parent.setStyleSheet("background-color:rgb(255,255,128)")
         self.close()
 
     def onPrintPressed(self):
@@ -701,8 +1109,7 @@ class SeatEditWindow(QtWidgets.QDialog):
             return
         
         #Генерация текста билета :
-        date = TODAY
-        session = self.session[-2:]
+        show, date, hall, start, duration, film = dbw.get_show(self.show, self.db)
         row = self.seatNo // 100
         seat = self.seatNo % 100
         fio = self.parent.parent.FIO        
@@ -710,7 +1117,9 @@ class SeatEditWindow(QtWidgets.QDialog):
         ticketPrint = "*" * 50 + "\n" + \
                       "Билет в кинотеатр.\n" + \
                       "Дата: {}\n".format(date) + \
-                      "Сеанс {}:00\n".format(session) + \
+                      "Сеанс {}\n".format(start) + \
+                      "Зал {}\n".format(hall) + \
+                      ("Фильм: {}\n".format(film) if film else "") + \
                       "Ряд {}\n".format(row) + \
                       "Место {}\n".format(seat) + \
                       "Оператор: {}\n".format(fio) + \
@@ -760,30 +1169,105 @@ class SeatEditWindow(QtWidgets.QDialog):
         
         sender = self.sender
         seatNo = self.seatNo
-        session = self.session
-        date = TODAY
-        db = self.db
-        dbw.return_seat(seatNo, session, date, db)
+        show = self.show
+        if not self.seats.return_seat(seatNo, show):
+            conflictMsg = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Warning,
+                                                "Возврат", "Билет на это место уже возвращен.",
+                                                buttons = QtWidgets.QMessageBox.Ok,
+                                                parent=self)
+            conflictMsg.exec()
+            self.parent.setStyleSheet("background-color:rgb(128,255,128)")
+            self.close()
+            return
         returnMsg = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Information,
                                           "Возврат", "Билет успешно возвращен",
                                           buttons = QtWidgets.QMessageBox.Ok,
                                           parent=self)
         returnMsg.exec()
         self.parent.setStyleSheet("background-color:rgb(128,255,128)")
+        self.parent.parent.onSeatsChanged([seatNo], show, -1)
         self.close()
 
     def checkTime(self):
         """
         Проверяем, не опоздали ли на сеанс.
         """
-        session = self.session
-        allowedTime = datetime.time(int(session[-2:])+1, 50)
-        currentTime = datetime.datetime.now().time()
-        if currentTime > allowedTime:
+        if self.show is None:
             return True
-        return False
+        return not dbw.is_sellable(self.show, datetime.datetime.now(), self.db)
 
     
+class DiagnosticsWindow(QtWidgets.QDialog):
+    """
+    Окно диагностики: статистика трассировки по функциям, запросам
+    и самые долгие запросы, с сохранением в файл
+    """
+    def __init__(self, tracer=None, parent=None):
+        QtWidgets.QWidget.__init__(self, parent)
+        self.parent = parent
+        self.tracer = tracer
+        self.initUI()
+
+    def initUI(self):
+        self.setWindowTitle("Диагностика")
+        self.resize(DEF_DIAGRAM_WI, DEF_DIAGRAM_HI)
+        if self.tracer is None:
+            captionLabel = QtWidgets.QLabel("<center><h2>Трассировка не включалась</h2></center>"
+                                            "<center>Сервис - Трассировка запросов</center>")
+        else:
+            report = self.tracer.report()
+            captionLabel = QtWidgets.QLabel("<center><h2>Трассировка с {0}, {1} с</h2></center>".format(
+                                            report["started"][:19], report["seconds"]))
+
+        self.buttonBox = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Save |
+                                                    QtWidgets.QDialogButtonBox.Close)
+        saveBtn = self.buttonBox.button(QtWidgets.QDialogButtonBox.Save)
+        saveBtn.setText("Сохранить...")
+        saveBtn.setEnabled(self.tracer is not None)
+        saveBtn.clicked.connect(self.onSavePressed)
+        closeBtn = self.buttonBox.button(QtWidgets.QDialogButtonBox.Close)
+        closeBtn.setText("Закрыть")
+        closeBtn.setIcon(QtGui.QIcon(ICONS["cancel"]))
+        self.buttonBox.rejected.connect(self.reject)
+
+        self.layout = QtWidgets.QVBoxLayout(self)
+        self.layout.addWidget(captionLabel)
+        if self.tracer is not None:
+            tabs = QtWidgets.QTabWidget(self)
+            columns = ("Вызовов", "Всего, мс", "Среднее, мкс")
+            tabs.addTab(self.makeTable(("Функция",) + columns,
+                                       [(row["name"], row["calls"], row["total_ms"], row["avg_us"])
+                                        for row in report["functions"]]), "Функции")
+            tabs.addTab(self.makeTable(("Запрос",) + columns,
+                                       [(row["name"], row["calls"], row["total_ms"], row["avg_us"])
+                                        for row in report["statements"]]), "Запросы")
+            tabs.addTab(self.makeTable(("мс", "Запрос"),
+                                       [(row["ms"], row["sql"]) for row in report["slowest"]]),
+                        "Самые долгие")
+            self.layout.addWidget(tabs)
+        self.layout.addWidget(self.buttonBox)
+
+    def makeTable(self, headers, rows):
+        """
+        Таблица только для чтения, текст запроса целиком - во всплывающей подсказке.
+        """
+        table = QtWidgets.QTableWidget(len(rows), len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                item = QtWidgets.QTableWidgetItem(str(value))
+                item.setToolTip(str(value))
+                table.setItem(i, j, item)
+        table.resizeColumnsToContents()
+        return table
+
+    def onSavePressed(self):
+        filename, selected = QtWidgets.QFileDialog.getSaveFileName(self, "Сохранить статистику",
+                                                                   "trace.json", "JSON (*.json)")
+        if filename:
+            self.tracer.dump(filename)
+
 class SeatsGraph(QtWidgets.QDialog):
     """
     Отображение графика кол-ва проданных мест
@@ -831,10 +1315,6 @@ class SeatsGraph(QtWidgets.QDialog):
         self.hbox.addWidget(self.finishDateSelector)
         self.hbox.addWidget(self.refreshSellsBtn, alignment=QtCore.Qt.AlignRight)
 
-        self.diagram = SeatsDiagram(db=self.db,
-                                    start=self.startDateSelector.date().toPyDate(),
-                                    finish=self.finishDateSelector.date().toPyDate())  #панель с графиком проданных по дням
-
         self.buttonBox = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Close)
         self.buttonBox.buttons()[0].setText("Закрыть")
         self.buttonBox.buttons()[0].setIcon(QtGui.QIcon(ICONS["cancel"]))
@@ -900,10 +1380,6 @@ class SalesGraph(QtWidgets.QDialog):
         self.hbox.addWidget(self.finishDateSelector)
         self.hbox.addWidget(self.refreshSellsBtn, alignment=QtCore.Qt.AlignRight)
 
-        self.diagram = SeatsDiagram(db=self.db,
-                                    start=self.startDateSelector.date().toPyDate(),
-                                    finish=self.finishDateSelector.date().toPyDate())  #панель с графиком выручки по дням
-
         self.buttonBox = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Close)
         self.buttonBox.buttons()[0].setText("Закрыть")
         self.buttonBox.buttons()[0].setIcon(QtGui.QIcon(ICONS["cancel"]))
@@ -943,6 +1419,10 @@ class SeatsDiagram(QtWidgets.QWidget):
         self.finish = finish
         self.parent = parent
         self.timeDelta = self.getTimeDelta()
+        self.values = self.getValues()
+        #верхняя граница оси У - наибольшая вместимость залов за день, шаг засечек - четверть
+        self.maxValue = max(self.capacities.values(), default=0) or 1
+        self.axisStep = max(-(-self.maxValue // 4), 1)
         #образмериваем виджет
         self.resize(DEF_DIAGRAM_WI, DEF_DIAGRAM_HI)
         self.setMinimumSize(DEF_DIAGRAM_WI, DEF_DIAGRAM_HI)
@@ -958,9 +1438,6 @@ class SeatsDiagram(QtWidgets.QWidget):
         """
         Рисуем: линии координат, засечки, подиписи, столбцы, подписи столбцов
         """
-        #Кв-фактор для масштабирования по высоте
-        Kv = (DEF_DIAGRAM_HI - DIAG_V_SPACING * 2 - AXIS_Y_SPACING) / MAX_SEATS_PER_DAY
-
         #Рисуем белый фон:
         qp.setPen(QtGui.QColor(BLACK))
         qp.setBrush(QtGui.QColor(WHITE))
@@ -988,10 +1465,10 @@ class SeatsDiagram(QtWidgets.QWidget):
         firstPointY = zeroPointY
         lastPointX = firstPointX
         lastPointY = endPointY + DIAG_V_SPACING // 2
-        Ky = (firstPointY - lastPointY) / (zeroPointY - endPointY)
-        for i in range(AXIS_Y_STEP, MAX_SEATS_PER_DAY+AXIS_Y_STEP, AXIS_Y_STEP):
+        Ky = (firstPointY - lastPointY) / (self.axisStep * 4)
+        for i in range(self.axisStep, self.axisStep*4+1, self.axisStep):
             startX = firstPointX - 5
-            startY = firstPointY - i * Ky
+            startY = int(firstPointY - i * Ky)
             endX = lastPointX + 5
             endY = startY
             qp.setPen(QtGui.QColor(BLACK))
@@ -1018,9 +1495,9 @@ class SeatsDiagram(QtWidgets.QWidget):
         firstPointY = zeroPointY
         lastPointX = endPointX - DIAG_H_SPACING // 2
         lastPointY = firstPointY
-        Kx = (lastPointX - firstPointX) / self.timeDelta
+        Kx = (lastPointX - firstPointX) / max(self.timeDelta, 1)
         for i in range(self.timeDelta+1):            
-            startX = firstPointX + i * Kx
+            startX = int(firstPointX + i * Kx)
             startY = firstPointY + 5
             endX = startX
             endY = lastPointY - 5
@@ -1033,14 +1510,14 @@ class SeatsDiagram(QtWidgets.QWidget):
                         QtCore.Qt.AlignCenter,
                         dateLabel.strftime('%d.%m'))
             #столбики диаграммы
-            seatsNum = random.randint(0, 400)
-            colWidth = Kx // 2 if Kx >= 20 else 10
-            colHight = seatsNum * Ky            
+            seatsNum = self.values.get(str(dateLabel), 0)
+            colWidth = int(Kx // 2) if Kx >= 20 else 10
+            colHight = int(seatsNum * Ky)
             qp.setPen(QtGui.QColor(BLUE))
             qp.setBrush(QtGui.QColor(CYAN))
-            qp.drawRect(startX-colWidth/2, firstPointY,
+            qp.drawRect(startX-colWidth//2, firstPointY,
                         colWidth, -colHight)
-            qp.drawText(startX-colWidth/2, startY-colHight-25,
+            qp.drawText(startX-colWidth//2, startY-colHight-25,
                         colWidth, 25,
                         QtCore.Qt.AlignCenter,
                         str(seatsNum))
@@ -1053,10 +1530,19 @@ class SeatsDiagram(QtWidgets.QWidget):
         timeDelta = self.finish - self.start
         return timeDelta.days
 
+    def getValues(self):
+        """
+        Загружаем кол-во проданных мест и вместимость залов за каждый день
+        диапазона одним запросом, возвращаем словарь дата: кол-во мест за день
+        """
+        report = dbw.report_by_places_range(self.start, self.finish, self.db, with_capacity=True)
+        self.capacities = {day[0]: day[-1] for day in report}  #вместимость залов по дням
+        return {day[0]: day[-3] for day in report}
+
 
 class SalesDiagram(QtWidgets.QWidget):
     """
-    Виджет с графиком проданных мест
+    Виджет с графиком выручки
     """
     def __init__(self, db=None, start=None, finish=None, parent=None):
         QtWidgets.QWidget.__init__(self, parent)
@@ -1065,6 +1551,11 @@ class SalesDiagram(QtWidgets.QWidget):
         self.finish = finish
         self.parent = parent
         self.timeDelta = self.getTimeDelta()
+        self.values = self.getValues()
+        #верхняя граница оси У - выручка за лучший день, округленная вверх до шага засечек
+        step = max(self.values.values(), default=0) // 4 // AXIS_Y_STEP + 1
+        self.axisStep = step * AXIS_Y_STEP
+        self.maxValue = self.axisStep * 4
         #образмериваем виджет
         self.resize(DEF_DIAGRAM_WI, DEF_DIAGRAM_HI)
         self.setMinimumSize(DEF_DIAGRAM_WI, DEF_DIAGRAM_HI)
@@ -1080,9 +1571,6 @@ class SalesDiagram(QtWidgets.QWidget):
         """
         Рисуем: линии координат, засечки, подиписи, столбцы, подписи столбцов
         """
-        #Кв-фактор для масштабирования по высоте
-        Kv = (DEF_DIAGRAM_HI - DIAG_V_SPACING * 2 - AXIS_Y_SPACING) / MAX_SEATS_PER_DAY
-
         #Рисуем белый фон:
         qp.setPen(QtGui.QColor(BLACK))
         qp.setBrush(QtGui.QColor(WHITE))
@@ -1110,10 +1598,10 @@ class SalesDiagram(QtWidgets.QWidget):
         firstPointY = zeroPointY
         lastPointX = firstPointX
         lastPointY = endPointY + DIAG_V_SPACING // 2
-        Ky = (firstPointY - lastPointY) / (zeroPointY - endPointY)
-        for i in range(AXIS_Y_STEP, MAX_SEATS_PER_DAY+AXIS_Y_STEP, AXIS_Y_STEP):
+        Ky = (firstPointY - lastPointY) / self.maxValue
+        for i in range(self.axisStep, self.maxValue+self.axisStep, self.axisStep):
             startX = firstPointX - 5
-            startY = firstPointY - i * Ky
+            startY = int(firstPointY - i * Ky)
             endX = lastPointX + 5
             endY = startY
             qp.setPen(QtGui.QColor(BLACK))
@@ -1140,9 +1628,9 @@ class SalesDiagram(QtWidgets.QWidget):
         firstPointY = zeroPointY
         lastPointX = endPointX - DIAG_H_SPACING // 2
         lastPointY = firstPointY
-        Kx = (lastPointX - firstPointX) / self.timeDelta
+        Kx = (lastPointX - firstPointX) / max(self.timeDelta, 1)
         for i in range(self.timeDelta+1):            
-            startX = firstPointX + i * Kx
+            startX = int(firstPointX + i * Kx)
             startY = firstPointY + 5
             endX = startX
             endY = lastPointY - 5
@@ -1155,14 +1643,14 @@ class SalesDiagram(QtWidgets.QWidget):
                         QtCore.Qt.AlignCenter,
                         dateLabel.strftime('%d.%m'))
             #столбики диаграммы
-            seatsNum = random.randint(0, 400)
-            colWidth = Kx // 2 if Kx >= 20 else 10
-            colHight = seatsNum * Ky            
+            seatsNum = self.values.get(str(dateLabel), 0)
+            colWidth = int(Kx // 2) if Kx >= 20 else 10
+            colHight = int(seatsNum * Ky)
             qp.setPen(QtGui.QColor(BLUE))
             qp.setBrush(QtGui.QColor(CYAN))
-            qp.drawRect(startX-colWidth/2, firstPointY,
+            qp.drawRect(startX-colWidth//2, firstPointY,
                         colWidth, -colHight)
-            qp.drawText(startX-colWidth/2, startY-colHight-25,
+            qp.drawText(startX-colWidth//2, startY-colHight-25,
                         colWidth, 25,
                         QtCore.Qt.AlignCenter,
                         str(seatsNum))
@@ -1174,14 +1662,25 @@ class SalesDiagram(QtWidgets.QWidget):
         """
         timeDelta = self.finish - self.start
         return timeDelta.days
+
+    def getValues(self):
+        """
+        Загружаем выручку за каждый день диапазона одним запросом,
+        возвращаем словарь дата: выручка за день
+        """
+        report = dbw.report_by_sales_range(self.start, self.finish, self.db)
+        return {day[0]: day[-1] for day in report}
         
  
 
 def main():
     app = QtWidgets.QApplication(sys.argv)
-    main_window = CinemaApp()
+    args = app.arguments()
+    server = args[args.index("--server") + 1] if "--server" in args[:-1] else None  #режим клиента сервера
+    main_window = CinemaApp(server=server)
     main_window.setWindowIcon(QtGui.QIcon(ICONS["main"]))
     app.setWindowIcon(QtGui.QIcon(ICONS["main"]))
+    main_window.exitAfterStartup = "--startup-time" in args  #замер времени запуска
     main_window.show()
     sys.exit(app.exec_())    
 
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# CinemaApp analytics.
+# Аналитика продаж за период на массивах NumPy.
+"""
+Модуль аналитики продаж поверх модуля dbworks. История зала за период
+загружается одним запросом в массив NumPy формы дни x сеансы x места,
+дальше заполняемость, скользящие средние, профиль по дням недели и выручка
+считаются операциями над массивом, без запроса на каждый день:
+
+    cube = load_cube(первый день, последний день, db)
+    cube.fill_by_day()
+
+Требуется пакет numpy, остальные модули приложения от него не зависят.
+"""
+
+import datetime
+import numpy as np
+import dbworks as dbw
+
+
+class OccupancyCube:
+    """
+    История продаж зала за период.
+    sold - массив uint8 дни x сеансы x места, 1 - место продано;
+    revenue - массив цен проданных билетов той же формы;
+    shows - массив bool дни x сеансы, True - сеанс был в расписании.
+    Сеансы дня нумеруются по времени начала, starts - время начала сеансов
+    по дням (строка '' там, где сеанса не было).
+    """
+    def __init__(self, dates, starts, sold, revenue, shows, layout):
+        self.dates = dates
+        self.starts = starts
+        self.sold = sold
+        self.revenue = revenue
+        self.shows = shows
+        self.layout = layout
+
+    def fill_by_day(self):
+        """
+        Заполняемость зала по дням, доля проданных мест всех сеансов дня.
+        Для дней без сеансов - 0.
+        """
+        capacity = self.shows.sum(axis=1) * self.sold.shape[2]
+        return np.divide(self.sold.sum(axis=(1, 2)), capacity,
+                         out=np.zeros(len(self.dates)), where=capacity > 0)
+
+    def fill_by_session(self):
+        """
+        Средняя заполняемость по порядковому номеру сеанса в дне.
+        """
+        capacity = self.shows.sum(axis=0) * self.sold.shape[2]
+        return np.divide(self.sold.sum(axis=(0, 2)), capacity,
+                         out=np.zeros(self.shows.shape[1]), where=capacity > 0)
+
+    def fill_by_seat(self):
+        """
+        Популярность мест: доля сеансов периода, на которые место было продано,
+        в порядке мест схемы зала.
+        """
+        count = self.shows.sum()
+        return self.sold.sum(axis=(0, 1)) / count if count else np.zeros(self.sold.shape[2])
+
+    def weekday_profile(self):
+        """
+        Средняя заполняемость по дням недели, понедельник - 0.
+        """
+        weekdays = np.array([date.weekday() for date in self.dates], dtype=np.intp)
+        fill = self.fill_by_day()
+        total = np.bincount(weekdays, weights=fill, minlength=7)
+        count = np.bincount(weekdays, minlength=7)
+        return np.divide(total, count, out=np.zeros(7), where=count > 0)
+
+    def revenue_by_day(self):
+        """
+        Выручка по дням.
+        """
+        return self.revenue.sum(axis=(1, 2))
+
+    def revenue_total(self):
+        """
+        Выручка за период.
+        """
+        return int(self.revenue.sum())
+
+
+def rolling_mean(values, window=7):
+    """
+    Аргументы: одномерный массив, ширина окна.
+    Скользящее среднее по окну из window последних значений, первые
+    значения усредняются по неполному окну.
+    """
+    values = np.asarray(values, dtype=float)
+    sums = np.cumsum(values)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return sums / counts
+
+
+def load_cube(start, finish, db, hall=1):
+    """
+    Аргументы: первый день, последний день (datetime.date), БД, номер зала.
+    Загружает расписание и проданные билеты зала за период (включая архивы
+    месяцев) и раскладывает их в OccupancyCube.
+    """
+    layout = dbw.get_hall(db, hall)
+    days = (finish - start).days + 1
+    dates = [start + datetime.timedelta(n) for n in range(days)]
+    showRecords, ticketRecords = [], []
+    for schema in dbw.partitions(start, finish, db):
+        cursor = db.cursor()
+        cursor.execute("SELECT show, date, start FROM {0}Shows \
+                        WHERE hall=? AND date BETWEEN ? AND ? \
+                        ORDER BY date, start".format(schema), (hall, str(start), str(finish)))
+        showRecords.extend(cursor.fetchall())
+        # места сеанса одной строкой через запятую: в разы меньше объектов Python
+        cursor.execute("SELECT t.show, COALESCE(t.price, 0), COUNT(*), group_concat(t.seat) \
+                        FROM {0}Tickets t JOIN {0}Shows sh ON sh.show=t.show \
+                        WHERE sh.hall=? AND sh.date BETWEEN ? AND ? \
+                        GROUP BY t.show, t.price".format(schema),
+                       (hall, str(start), str(finish)))
+        ticketRecords.extend(cursor.fetchall())
+    # порядковый номер сеанса в дне: сеансы уже упорядочены по дате и началу
+    dayOf, slotOf, previous, slot = [], [], None, 0
+    for show, date, begin in showRecords:
+        slot = slot + 1 if date == previous else 0
+        previous = date
+        dayOf.append((datetime.date.fromisoformat(date) - start).days)
+        slotOf.append(slot)
+    slots = max(slotOf) + 1 if slotOf else 0
+    shows = np.zeros((days, slots), dtype=bool)
+    starts = np.full((days, slots), "", dtype="<U5")
+    if showRecords:
+        shows[dayOf, slotOf] = True
+        starts[dayOf, slotOf] = [record[2] for record in showRecords]
+    sold = np.zeros((days, slots, len(layout)), dtype=np.uint8)
+    revenue = np.zeros((days, slots, len(layout)), dtype=np.int64)
+    if ticketRecords:
+        # номер сеанса -> (день, сеанс дня) и номер места -> индекс места через таблицы поиска
+        showIds = np.array([record[0] for record in showRecords])
+        order = np.argsort(showIds)
+        counts = np.array([record[2] for record in ticketRecords])
+        ticketShows = np.repeat([record[0] for record in ticketRecords], counts)
+        prices = np.repeat([record[1] for record in ticketRecords], counts)
+        seatCodes = np.array(",".join(record[3] for record in ticketRecords).split(","),
+                             dtype=np.int64)
+        position = order[np.searchsorted(showIds, ticketShows, sorter=order)]
+        seatIndex = np.full(max(layout.seats) + 1, -1, dtype=np.intp)
+        seatIndex[layout.seats] = np.arange(len(layout))
+        inHall = seatCodes < len(seatIndex)
+        seats = np.where(inHall, seatIndex[np.where(inHall, seatCodes, 0)], -1)
+        valid = seats >= 0   # места, которых нет в текущей схеме зала, пропускаем
+        dayIndex = np.array(dayOf)[position][valid]
+        slotIndex = np.array(slotOf)[position][valid]
+        sold[dayIndex, slotIndex, seats[valid]] = 1
+        revenue[dayIndex, slotIndex, seats[valid]] = prices[valid]
+    return OccupancyCube(dates, starts, sold, revenue, shows, layout)
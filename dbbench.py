@@ -0,0 +1,689 @@
+#!/usr/bin/python
+# CinemaApp dbworks benchmarks.
+# Замеры производительности модуля работы с базой данных.
+"""
+Набор замеров скорости функций модуля dbworks на временных базах данных.
+Запуск из консоли:
+
+    python dbbench.py
+
+Базы создаются во временном каталоге и удаляются по окончанию замера.
+Воспроизводимый набор замеров основных функций с сохранением в JSON,
+чтобы сравнивать версии между собой обычным diff:
+
+    python dbbench.py suite -o bench.json
+"""
+
+import os, sqlite3, tempfile, datetime, time, random, multiprocessing, asyncio, json, \
+       tracemalloc, argparse, platform
+import dbworks as dbw
+import dbserver
+try:
+    import dbanalytics
+except ImportError:     # нет numpy - замер аналитики пропускается
+    dbanalytics = None
+
+HISTORY = (1, 10, 100, 1000, 2000)  # глубина истории в днях
+LOOKUPS = 2000                      # кол-во запросов в одном замере
+WRITERS = 4                         # кол-во одновременно продающих процессов
+SALES_PER_WRITER = 400              # кол-во продаж каждого процесса
+CLIENTS = 16                        # кол-во касс, подключенных к серверу
+REQUESTS_PER_CLIENT = 500           # кол-во запросов каждой кассы к серверу
+FIRST_DAY = datetime.date(2020, 1, 1)
+SUITE_DAYS = (1, 30, 365, 3650)     # глубина истории в наборе замеров
+SUITE_CALLS = {                     # кол-во вызовов каждой функции в наборе замеров
+    "new_day": 100,
+    "isVacancy": 5000,
+    "sell_seat": 2000,
+    "return_seat": 2000,
+    "report_by_places": 500,
+    "report_by_sales": 500,
+}
+PERCENTILES = (50, 90, 99)
+
+
+def seed_days(days, db, fill=0.5, first=FIRST_DAY):
+    """
+    Аргументы: кол-во дней, БД, доля проданных мест, первый день.
+    Быстрое наполнение базы днями по расписанию по умолчанию со случайно
+    проданными местами в одной транзакции, минуя sell_seat.
+    """
+    rnd = random.Random(days)
+    hall = dbw.hall_seats()
+    dbw.new_days(first, first + datetime.timedelta(days - 1), 30, db)
+    tickets = []
+    for show, date in db.execute("SELECT show, date FROM Shows"):
+        for seat in hall:
+            if rnd.random() < fill:
+                tickets.append((show, date, seat, 30))
+    with db:
+        db.executemany("INSERT INTO Tickets(show, date, seat, price) \
+                        VALUES (?, ?, ?, ?)", tickets)
+
+def day_shows(date, db):
+    """
+    Аргументы: дата, БД.
+    Возвращает список номеров сеансов дня.
+    """
+    return [show[0] for show in dbw.shows(date, db)]
+
+def percentile(values, p):
+    """
+    Аргументы: упорядоченный список значений, процент.
+    Перцентиль по ближайшему рангу.
+    """
+    return values[max(0, -(-len(values) * p // 100) - 1)]
+
+def timings(func, args):
+    """
+    Аргументы: функция, список кортежей аргументов.
+    Вызывает функцию по разу на каждый кортеж, возвращает словарь с числом
+    вызовов, операциями в секунду и перцентилями времени вызова в мкс.
+    """
+    clock = time.perf_counter
+    latencies = []
+    for arg in args:
+        start = clock()
+        func(*arg)
+        latencies.append(clock() - start)
+    total = sum(latencies)
+    latencies.sort()
+    result = {"calls": len(latencies),
+              "ops_per_sec": round(len(latencies) / total, 1) if total else None}
+    for p in PERCENTILES:
+        result["p{0}_us".format(p)] = round(percentile(latencies, p) * 1e6, 1)
+    result["max_us"] = round(latencies[-1] * 1e6, 1)
+    return result
+
+def bench_functions(days, profile="terminal", calls=SUITE_CALLS):
+    """
+    Аргументы: кол-во дней истории, профиль подключения, кол-во вызовов функций.
+    Замер new_day, isVacancy, sell_seat, return_seat, report_by_places и
+    report_by_sales на временной базе с историей days дней. Аргументы вызовов
+    выбираются генератором с постоянным зерном, поэтому замер воспроизводим.
+    Возвращает словарь имя функции: результат timings.
+    """
+    rnd = random.Random(days)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db = dbw.connect_DB(os.path.join(tmp, "bench.db"), "bulk")
+        seed_days(days, db)
+        db.close()
+        db = dbw.connect_DB(os.path.join(tmp, "bench.db"), profile)
+        hall = dbw.hall_seats()
+        history = [FIRST_DAY + datetime.timedelta(n) for n in range(days)]
+        historyShows = [show for (show,) in db.execute("SELECT show FROM Shows")]
+        # новые дни после истории, в них же идут продажи и возвраты
+        newDays = [(FIRST_DAY + datetime.timedelta(days + n), 30, db)
+                   for n in range(calls["new_day"])]
+        results["new_day"] = timings(dbw.new_day, newDays)
+        newShows = [show for date, price, db in newDays for show in day_shows(date, db)]
+        results["isVacancy"] = timings(dbw.isVacancy,
+                                       [(rnd.choice(hall), rnd.choice(historyShows), db)
+                                        for n in range(calls["isVacancy"])])
+        places = rnd.sample([(seat, show) for show in newShows for seat in hall],
+                            calls["sell_seat"])
+        results["sell_seat"] = timings(dbw.sell_seat,
+                                       [(seat, show, 30, db) for seat, show in places])
+        results["return_seat"] = timings(dbw.return_seat,
+                                         [(seat, show, db) for seat, show in
+                                          places[:calls["return_seat"]]])
+        for name in ("report_by_places", "report_by_sales"):
+            results[name] = timings(getattr(dbw, name),
+                                    [(rnd.choice(history), db) for n in range(calls[name])])
+        db.close()
+    return results
+
+def bench_suite(filename=None, sizes=SUITE_DAYS, profile="terminal"):
+    """
+    Аргументы: файл результатов JSON (None - не сохранять), глубины истории
+    в днях, профиль подключения.
+    Набор замеров bench_functions по всем глубинам истории. Печатает таблицу
+    и сохраняет результаты с версиями схемы, Python и SQLite.
+    """
+    report = {"schema_version": dbw.SCHEMA_VERSION,
+              "python": platform.python_version(),
+              "sqlite": sqlite3.sqlite_version,
+              "profile": profile,
+              "days": {}}
+    print("{0:>6} {1:<18}{2:>12}{3:>10}{4:>10}{5:>10}".format("Дней", "Функция", "оп/с",
+                                                           "p50 мкс", "p90 мкс", "p99 мкс"))
+    for days in sizes:
+        results = report["days"][str(days)] = bench_functions(days, profile)
+        for name, result in results.items():
+            print("{0:>6} {1:<18}{2:>12.0f}{3:>10.1f}{4:>10.1f}{5:>10.1f}".format(
+                  days, name, result["ops_per_sec"],
+                  result["p50_us"], result["p90_us"], result["p99_us"]))
+    if filename:
+        with open(filename, "w", encoding="utf8") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+            file.write("\n")
+    return report
+
+def bench_lookup(days):
+    """
+    Аргументы: кол-во дней истории.
+    Возвращает среднее время одного вызова isVacancy в микросекундах.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "bench.db")
+        db = dbw.connect_DB(filename)
+        seed_days(days, db)
+        shows = day_shows(FIRST_DAY + datetime.timedelta(days - 1), db)
+        start = time.perf_counter()
+        for n in range(LOOKUPS):
+            seat = (n % 10 + 1) * 100 + n % 10 + 1
+            dbw.isVacancy(seat, shows[n % len(shows)], db)
+        elapsed = time.perf_counter() - start
+        db.close()
+    return elapsed / LOOKUPS * 1e6
+
+def bench_history():
+    """
+    Замер поиска места в зависимости от глубины истории.
+    """
+    print("isVacancy, мкс на вызов")
+    print("{0:>6}|{1:>12}".format("Дней", "мкс"))
+    for days in HISTORY:
+        print("{0:>6}|{1:>12.1f}".format(days, bench_lookup(days)))
+
+def formatted_isVacancy(seatNo, show, db):
+    """
+    Вариант isVacancy с текстом запроса, собранным через str.format,
+    для сравнения с запросом на связанных параметрах.
+    """
+    cursor = db.cursor()
+    sql = "SELECT RecNo \
+           FROM Tickets \
+           WHERE show={0} AND seat={1}".format(show, seatNo)
+    cursor.execute(sql)
+    return cursor.fetchone() is not None
+
+def bench_statements(days=100):
+    """
+    Аргументы: кол-во дней истории.
+    Замер пропускной способности isVacancy и пары sell_seat/return_seat,
+    сравнение запросов через str.format и через связанные параметры.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "bench.db")
+        db = dbw.connect_DB(filename)
+        seed_days(days, db)
+        hall = dbw.hall_seats()
+        shows = day_shows(FIRST_DAY + datetime.timedelta(days // 2), db)
+        print("Операций в секунду, история {0} дней".format(days))
+        for name, func in (("isVacancy str.format", formatted_isVacancy),
+                           ("isVacancy параметры", dbw.isVacancy)):
+            start = time.perf_counter()
+            for n in range(LOOKUPS * 5):
+                func(hall[n % len(hall)], shows[n % len(shows)], db)
+            print("{0:<24}{1:>10.0f}".format(name, LOOKUPS * 5 / (time.perf_counter() - start)))
+        # продажа и возврат без fsync, чтобы замерять выполнение запросов, а не диск
+        db.execute("PRAGMA synchronous = OFF")
+        dbw.new_day(FIRST_DAY + datetime.timedelta(days), 30, db)
+        shows = day_shows(FIRST_DAY + datetime.timedelta(days), db)
+        start = time.perf_counter()
+        for n in range(LOOKUPS):
+            seat, show = hall[n % len(hall)], shows[n % len(shows)]
+            dbw.sell_seat(seat, show, 30, db)
+            dbw.return_seat(seat, show, db)
+        print("{0:<24}{1:>10.0f}".format("sell_seat+return_seat",
+                                         LOOKUPS / (time.perf_counter() - start)))
+        db.close()
+
+def bench_group(seats=100, repeats=20):
+    """
+    Аргументы: кол-во мест в группе, кол-во повторов.
+    Замер стоимости одного места при групповой продаже и возврате одной
+    транзакцией против продажи и возврата по одному месту.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db = dbw.connect_DB(os.path.join(tmp, "bench.db"))
+        layout = dbw.HallLayout([dbw.SEAT_MARK * 10] * (seats // 10))
+        dbw.save_hall(layout, db)
+        dbw.new_day(FIRST_DAY, 30, db)
+        show = day_shows(FIRST_DAY, db)[0]
+        group = layout.seats
+        single = bulk = 0
+        for n in range(repeats):
+            start = time.perf_counter()
+            for seat in group:
+                dbw.sell_seat(seat, show, 30, db)
+            for seat in group:
+                dbw.return_seat(seat, show, db)
+            single += time.perf_counter() - start
+            start = time.perf_counter()
+            dbw.sell_seats(group, show, 30, db)
+            dbw.return_seats(group, show, db)
+            bulk += time.perf_counter() - start
+        db.close()
+    perSeat = 1e6 / (repeats * len(group))
+    print("Группа {0} мест, мкс на место (продажа+возврат)".format(len(group)))
+    print("{0:<24}{1:>10.1f}".format("по одному месту", single * perSeat))
+    print("{0:<24}{1:>10.1f}".format("sell_seats/return_seats", bulk * perSeat))
+
+def bench_holds(holds=500):
+    """
+    Аргументы: кол-во одновременных броней.
+    Замер isVacancy без брони и при holds действующих бронях, скорости
+    бронирования и снятия просроченной брони планировщиком.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db = dbw.connect_DB(os.path.join(tmp, "bench.db"), "bulk")
+        seed_days(10, db)
+        hall = dbw.hall_seats()
+        shows = [show for show, in db.execute("SELECT show FROM Shows")]
+        def lookups():
+            start = time.perf_counter()
+            for n in range(LOOKUPS):
+                dbw.isVacancy(hall[n % len(hall)], shows[n % len(shows)], db)
+            return LOOKUPS / (time.perf_counter() - start)
+        before = lookups()
+        scheduler = dbw.HoldScheduler(db)
+        start = time.perf_counter()
+        held = 0
+        for n in range(holds * 3):  # часть мест уже продана
+            if scheduler.hold_seat(hall[n % len(hall)], shows[n // len(hall)],
+                                   operator="op{0}".format(n % 8), ttl=60) is not None:
+                held += 1
+            if held == holds:
+                break
+        hold = held / (time.perf_counter() - start)
+        after = lookups()
+        start = time.perf_counter()
+        scheduler.reclaim(time.time() + 61)
+        reclaim = time.perf_counter() - start
+        db.close()
+    print("Бронь: {0:.0f} броней/с, снятие {1} броней {2:.2f} мс".format(hold, held, reclaim * 1e3))
+    print("{0:<24}{1:>10.0f}".format("isVacancy без брони", before))
+    print("{0:<24}{1:>10.0f}".format("isVacancy с бронью", after))
+
+def bench_write_behind(sales=4000):
+    """
+    Аргументы: кол-во продаж.
+    Сравнение скорости продаж через sell_seat в профилях terminal и safe
+    с режимом отложенной записи WriteBehind, время включает перенос в базу.
+    """
+    print("{0} продаж, продаж в секунду".format(sales))
+    days = -(-sales // (len(dbw.DEFAULT_SCHEDULE) * len(dbw.hall_seats())))
+    for name in ("terminal", "safe", "write-behind"):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "bench.db")
+            db = dbw.connect_DB(filename, "safe" if name == "write-behind" else name)
+            dbw.new_days(FIRST_DAY, FIRST_DAY + datetime.timedelta(days - 1), 30, db)
+            shows = [show for show, in db.execute("SELECT show FROM Shows")]
+            hall = dbw.hall_seats()
+            if name == "write-behind":
+                db.close()
+                db = dbw.WriteBehind(filename, profile="safe")
+                sell = db.sell_seat
+            else:
+                sell = lambda seat, show, price: dbw.sell_seat(seat, show, price, db)
+            start = time.perf_counter()
+            for n in range(sales):
+                sell(hall[n % len(hall)], shows[n // len(hall)], 30)
+            if name == "write-behind":
+                db.flush()
+            elapsed = time.perf_counter() - start
+            db.close()
+        print("{0:<24}{1:>10.0f}".format(name, sales / elapsed))
+
+def bench_archive(days=365):
+    """
+    Аргументы: кол-во дней истории, заканчивающейся сегодня.
+    Размер рабочей базы, поиск места и отчет за весь период до и после
+    переноса закрытых месяцев в архивы.
+    """
+    today = datetime.date.today()
+    first = today - datetime.timedelta(days - 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "bench.db")
+        db = dbw.connect_DB(filename, "bulk")
+        seed_days(days, db, first=first)
+        shows = day_shows(today, db)
+        hall = dbw.hall_seats()
+        print("История {0} дней".format(days))
+        print("{0:<12}{1:>10}{2:>16}{3:>12}".format("", "База, КБ", "isVacancy, мкс", "Отчет, мс"))
+        for name in ("до архива", "после"):
+            if name == "после":
+                dbw.archive_closed(db, keep=0)
+                db.execute("VACUUM")
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            start = time.perf_counter()
+            for n in range(LOOKUPS):
+                dbw.isVacancy(hall[n % len(hall)], shows[n % len(shows)], db)
+            lookup = (time.perf_counter() - start) / LOOKUPS
+            start = time.perf_counter()
+            report = dbw.report_by_places_range(first, today, db)
+            elapsed = time.perf_counter() - start
+            print("{0:<12}{1:>10.0f}{2:>16.1f}{3:>12.1f}   дней в отчете {4}".format(
+                  name, os.path.getsize(filename) / 1024, lookup * 1e6, elapsed * 1e3, len(report)))
+        db.close()
+
+def bench_export(days=2500):
+    """
+    Аргументы: кол-во дней с полностью проданными залами (по 400 билетов в день).
+    Скорость потоковой выгрузки всех билетов в CSV и JSON Lines
+    и наибольший объем памяти, занятой при выгрузке.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db = dbw.connect_DB(os.path.join(tmp, "bench.db"), "bulk")
+        seed_days(days, db, fill=1)
+        for fmt in ("csv", "jsonl"):
+            filename = os.path.join(tmp, "tickets." + fmt)
+            start = time.perf_counter()
+            rows = dbw.export_tickets(filename, db)
+            elapsed = time.perf_counter() - start
+            tracemalloc.start()
+            dbw.export_tickets(filename, db, finish=FIRST_DAY + datetime.timedelta(days // 10))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("Выгрузка {0} строк в {1}: {2:.1f} с, {3:.0f} строк/с, память до {4:.0f} КБ".format(
+                  rows, fmt, elapsed, rows / elapsed, peak / 1024))
+        db.close()
+
+def bench_analytics(days=1095):
+    """
+    Аргументы: кол-во дней истории (по умолчанию 3 года).
+    Заполняемость по дням и по дням недели и выручка за период: цикл
+    report_by_places/report_by_sales по дням против куба dbanalytics.
+    """
+    if dbanalytics is None:
+        print("Аналитика: numpy не установлен, замер пропущен")
+        return
+    finish = FIRST_DAY + datetime.timedelta(days - 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = dbw.connect_DB(os.path.join(tmp, "bench.db"), "bulk")
+        seed_days(days, db)
+        start = time.perf_counter()
+        weekdays = [[] for n in range(7)]
+        revenue = 0
+        for n in range(days):
+            date = FIRST_DAY + datetime.timedelta(n)
+            weekdays[date.weekday()].append(dbw.report_by_places(date, db)[-1])
+            revenue += dbw.report_by_sales(date, db)[-1]
+        profile = [sum(values) / len(values) for values in weekdays]
+        loop = time.perf_counter() - start
+        start = time.perf_counter()
+        cube = dbanalytics.load_cube(FIRST_DAY, finish, db)
+        load = time.perf_counter() - start
+        start = time.perf_counter()
+        cubeProfile = cube.weekday_profile()
+        cubeRevenue = cube.revenue_total()
+        dbanalytics.rolling_mean(cube.fill_by_day(), 28)
+        cube.fill_by_seat()
+        cube.fill_by_session()
+        vector = time.perf_counter() - start
+        db.close()
+    assert cubeRevenue == revenue and max(abs(cubeProfile - profile)) < 1e-9
+    print("Аналитика за {0} дней".format(days))
+    print("{0:<40}{1:>8.1f} мс".format("цикл report_by_* по дням", loop * 1e3))
+    print("{0:<40}{1:>8.1f} мс".format("загрузка куба (с данными по местам)", load * 1e3))
+    print("{0:<40}{1:>8.1f} мс".format("расчеты по кубу", vector * 1e3))
+
+def bench_popularity(days=365):
+    """
+    Аргументы: кол-во дней истории.
+    Тепловая карта зала за период: агрегирующий запрос seat_popularity против
+    повторного переключения из PopularityCache и внесения продажи в кэш.
+    """
+    finish = FIRST_DAY + datetime.timedelta(days - 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = dbw.connect_DB(os.path.join(tmp, "bench.db"), "bulk")
+        seed_days(days, db)
+        cache = dbw.PopularityCache(db)
+        start = time.perf_counter()
+        counts, shows = cache.get(FIRST_DAY, finish)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        for n in range(LOOKUPS):
+            cache.get(FIRST_DAY, finish)
+        warm = (time.perf_counter() - start) / LOOKUPS
+        show = day_shows(finish, db)[0]
+        seatNo = min(set(dbw.hall_seats()) - dbw.occupancy(show, db))
+        dbw.sell_seat(seatNo, show, 30, db)
+        start = time.perf_counter()
+        cache.update([seatNo], show, 1)
+        update = time.perf_counter() - start
+        assert cache.get(FIRST_DAY, finish) == dbw.seat_popularity(FIRST_DAY, finish, db)
+        db.close()
+    print("Тепловая карта за {0} дней, {1} сеансов".format(days, shows))
+    print("{0:<40}{1:>8.1f} мс".format("агрегирующий запрос", cold * 1e3))
+    print("{0:<40}{1:>8.1f} мкс".format("повторное переключение из кэша", warm * 1e6))
+    print("{0:<40}{1:>8.1f} мкс".format("внесение продажи в кэш", update * 1e6))
+
+def bench_generate(years=10, schedule=("10:00", "13:00", "16:00", "19:00", "22:00"),
+                   halls=(1, 2, 3)):
+    """
+    Аргументы: кол-во лет истории, расписание, номера залов.
+    Скорость наполнения базы генератором generate_history.
+    """
+    finish = FIRST_DAY + datetime.timedelta(365 * years - 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "bench.db")
+        db = dbw.connect_DB(filename, "bulk")
+        start = time.perf_counter()
+        days, sold = dbw.generate_history(FIRST_DAY, finish, db, seed=1,
+                                          schedule=schedule, halls=halls)
+        elapsed = time.perf_counter() - start
+        assert not dbw.check_summary(db)
+        # диапазон с уже зарегистрированным днем с продажами: день не меняется
+        first = finish + datetime.timedelta(10)
+        dbw.new_day(first + datetime.timedelta(5), 30, db)
+        show = day_shows(first + datetime.timedelta(5), db)[0]
+        dbw.sell_seat(101, show, 30, db)
+        added, extra = dbw.generate_history(first, first + datetime.timedelta(30), db, seed=2,
+                                            schedule=schedule, halls=halls)
+        assert added == 30 and dbw.occupancy(show, db) == {101} and not dbw.check_summary(db)
+        db.close()
+        size = os.path.getsize(filename)
+    print("Генератор истории: {0} дней, {1} билетов, {2:.1f} МБ".format(days, sold, size / 2**20))
+    print("{0:<40}{1:>8.1f} с".format("наполнение", elapsed))
+    print("{0:<40}{1:>8.0f}".format("билетов в секунду", sold / elapsed))
+
+def _writer(filename, profile, number, start_event, results):
+    """
+    Процесс-касса: продает места на свой день и считает ошибки блокировки.
+    """
+    db = dbw.ConnectionManager(filename, profile).connection()
+    date = FIRST_DAY + datetime.timedelta(number)
+    hall = dbw.hall_seats()
+    dbw.new_day(date, 30, db)
+    shows = day_shows(date, db)
+    sold = errors = 0
+    start_event.wait()
+    start = time.perf_counter()
+    for n in range(SALES_PER_WRITER):
+        try:
+            if dbw.sell_seat(hall[n % len(hall)], shows[n // len(hall) % len(shows)], 30, db):
+                sold += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put(("writer", sold, errors, time.perf_counter() - start))
+
+def _reader(filename, profile, start_event, stop_event, results):
+    """
+    Процесс-отчет: непрерывно строит отчеты, пока кассы продают билеты.
+    """
+    db = dbw.ConnectionManager(filename, profile).connection()
+    reports = errors = 0
+    start_event.wait()
+    start = time.perf_counter()
+    while not stop_event.is_set():
+        try:
+            dbw.report_by_places_range(FIRST_DAY, FIRST_DAY + datetime.timedelta(WRITERS), db)
+            dbw.occupancy(1, db)
+            reports += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put(("reader", reports, errors, time.perf_counter() - start))
+
+def bench_concurrency(profile):
+    """
+    Аргументы: профиль подключения.
+    Нагрузочный тест: WRITERS процессов одновременно продают билеты в одну
+    базу, еще один процесс строит отчеты. Все процессы подключаются к еще не
+    созданной базе одновременно, заодно проверяется конкурентная миграция.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "bench.db")
+        start_event, stop_event = multiprocessing.Event(), multiprocessing.Event()
+        results = multiprocessing.Queue()
+        writers = [multiprocessing.Process(target=_writer,
+                                           args=(filename, profile, n, start_event, results))
+                   for n in range(WRITERS)]
+        reader = multiprocessing.Process(target=_reader,
+                                         args=(filename, profile, start_event, stop_event, results))
+        for process in writers + [reader]:
+            process.start()
+        start = time.perf_counter()
+        start_event.set()
+        stats = [results.get() for process in writers]
+        elapsed = time.perf_counter() - start
+        stop_event.set()
+        stats.append(results.get())
+        for process in writers + [reader]:
+            process.join()
+        sold = sum(item[1] for item in stats if item[0] == "writer")
+        errors = sum(item[2] for item in stats)
+        reports = stats[-1][1]
+        print("{0:<10}{1:>10}{2:>12.0f}{3:>10}{4:>10}".format(profile, sold, sold / elapsed,
+                                                           reports, errors))
+
+def bench_profiles():
+    """
+    Сравнение профилей подключения под одновременной нагрузкой.
+    """
+    print("{0} касс по {1} продаж и процесс отчетов".format(WRITERS, SALES_PER_WRITER))
+    print("{0:<10}{1:>10}{2:>12}{3:>10}{4:>10}".format("Профиль", "Продано", "Продаж/с",
+                                                       "Отчетов", "Ошибок"))
+    for profile in ("legacy", "terminal", "safe"):
+        bench_concurrency(profile)
+
+async def _client(port, shows, hall, number, latencies):
+    """
+    Касса нагрузочного теста сервера: продает и возвращает места и
+    запрашивает занятость, замеряя задержку каждого запроса.
+    """
+    reader, writer = await asyncio.open_connection(dbserver.HOST, port)
+    rnd = random.Random(number)
+    for n in range(REQUESTS_PER_CLIENT):
+        show = shows[rnd.randrange(len(shows))]
+        seat = hall[rnd.randrange(len(hall))]
+        kind = rnd.random()
+        if kind < 0.5:
+            request = {"op": "occupancy", "show": show}
+        elif kind < 0.8:
+            request = {"op": "sell", "show": show, "seats": [seat], "price": 30}
+        else:
+            request = {"op": "return", "show": show, "seats": [seat]}
+        start = time.perf_counter()
+        writer.write(json.dumps(request).encode("utf8") + b"\n")
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+        if "error" in response:
+            raise dbserver.BookingError(response["error"])
+    writer.close()
+
+async def _load(filename, profile):
+    """
+    Запускает сервер на свободном порту и CLIENTS касс одновременно.
+    Возвращает время теста и список задержек.
+    """
+    server = dbserver.BookingServer(filename, profile)
+    port = await server.start(port=0)
+    shows = [show for show, in await server.run_db(server.db.execute, "SELECT show FROM Shows")]
+    hall = dbw.hall_seats()
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[_client(port, shows, hall, n, latencies) for n in range(CLIENTS)])
+    elapsed = time.perf_counter() - start
+    await server.close()
+    return elapsed, latencies
+
+def bench_server(profile="terminal"):
+    """
+    Аргументы: профиль подключения сервера.
+    Нагрузочный тест сервера продажи билетов: запросов в секунду
+    и задержки (медиана, p99) при CLIENTS одновременно работающих кассах.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "bench.db")
+        db = dbw.connect_DB(filename)
+        dbw.new_days(FIRST_DAY, FIRST_DAY + datetime.timedelta(4), 30, db)
+        db.close()
+        elapsed, latencies = asyncio.run(_load(filename, profile))
+    latencies.sort()
+    print("Сервер, {0} касс по {1} запросов, профиль {2}".format(CLIENTS, REQUESTS_PER_CLIENT,
+                                                                 profile))
+    print("{0:>10.0f} запросов/с, медиана {1:.2f} мс, p99 {2:.2f} мс".format(
+          len(latencies) / elapsed, latencies[len(latencies) // 2] * 1e3,
+          latencies[int(len(latencies) * 0.99)] * 1e3))
+
+def bench_hall(rows=40, seats=30):
+    """
+    Аргументы: кол-во рядов, мест в ряду.
+    Замер разбора схемы большого зала, загрузки карты занятости сеанса
+    и отчета по проданным местам.
+    """
+    text = "\n".join([dbw.SEAT_MARK * (seats // 2) + ".." + dbw.SEAT_MARK * (seats // 2)] * rows)
+    start = time.perf_counter()
+    layout = dbw.HallLayout(text.splitlines())
+    parse = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as tmp:
+        db = dbw.connect_DB(os.path.join(tmp, "bench.db"))
+        dbw.save_hall(layout, db)
+        date = str(FIRST_DAY)
+        dbw.new_day(date, 30, db)
+        shows = day_shows(date, db)
+        with db:
+            db.executemany("INSERT INTO Tickets(show, date, seat, price) VALUES (?, ?, ?, ?)",
+                           [(show, date, seat, 30) for show in shows
+                            for seat in layout.seats[::2]])
+        start = time.perf_counter()
+        for n in range(100):
+            dbw.OccupancyCache(db, layout=layout).occupancy(shows[n % len(shows)])
+        load = (time.perf_counter() - start) / 100
+        start = time.perf_counter()
+        for n in range(100):
+            dbw.report_by_places(date, db)
+        report = (time.perf_counter() - start) / 100
+        db.close()
+    print("Зал на {0} мест: схема {1:.2f} мс, занятость сеанса {2:.2f} мс, отчет {3:.2f} мс".format(
+          len(layout), parse * 1e3, load * 1e3, report * 1e3))
+
+
+def run_all():
+    """
+    Все замеры по очереди.
+    """
+    bench_history()
+    bench_statements()
+    bench_group()
+    bench_holds()
+    bench_write_behind()
+    bench_archive()
+    bench_export()
+    bench_analytics()
+    bench_popularity()
+    bench_generate()
+    bench_profiles()
+    bench_server("terminal")
+    bench_server("safe")
+    bench_hall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры производительности dbworks.")
+    commands = parser.add_subparsers(dest="command")
+    suite = commands.add_parser("suite", help="набор замеров основных функций с выводом в JSON")
+    suite.add_argument("-o", "--output", help="файл результатов JSON")
+    suite.add_argument("--days", type=int, nargs="+", default=SUITE_DAYS,
+                       help="глубины истории в днях")
+    suite.add_argument("--profile", default="terminal", choices=sorted(dbw.PROFILES))
+    args = parser.parse_args()
+    if args.command == "suite":
+        bench_suite(args.output, args.days, args.profile)
+    else:
+        run_all()
@@ -0,0 +1,392 @@
+#!/usr/bin/python
+# CinemaApp booking server.
+# Сервер продажи билетов для нескольких касс.
+"""
+Сервер продажи билетов поверх модуля dbworks. Кассы подключаются к нему по
+локальному сокету вместо того, чтобы писать в файл базы данных напрямую.
+Все записи проходят через одну задачу-писатель, которая объединяет
+накопившиеся запросы в одну транзакцию (групповая фиксация), занятость
+залов отдается из памяти. Запуск из консоли:
+
+    python dbserver.py CinemaDB.db --port 8765
+
+Протокол - по одному JSON-объекту в строке в обе стороны. Запрос:
+
+    {"op": "sell", "show": 1, "seats": [101, 102], "price": 30, "operator": "..."}
+
+ответ {"result": ...} или {"error": "текст ошибки"}. Операции:
+sell, return, hold, release, day (регистрация дня {"date": "ГГГГ-ММ-ДД",
+"price": 30}) - запись; occupancy, isVacancy, holds - чтение.
+"""
+
+import asyncio, json, socket, sqlite3, time, datetime, argparse, concurrent.futures
+import dbworks as dbw
+
+HOST = "127.0.0.1"
+PORT = 8765
+GROUP_MAX = 256    # наибольшее кол-во запросов в одной транзакции
+RECLAIM_EVERY = 1  # период снятия просроченной брони, сек
+WRITES = ("sell", "return", "hold", "release", "day")
+REQUIRED = {"sell": ("show", "seats", "price"),   # обязательные поля запросов на запись
+            "return": ("show", "seats"),
+            "hold": ("show", "seat"),
+            "release": ("show", "seat"),
+            "day": ("date", "price")}
+
+
+class BookingError(Exception):
+    """
+    Ошибка, которую вернул сервер в ответ на запрос.
+    """
+
+
+class BookingServer:
+    """
+    Сервер продажи билетов. Вся работа с БД идет в одном отдельном потоке,
+    чтобы цикл событий не ждал диска. Занятость сеансов хранится в памяти,
+    при промахе загружается из БД и дальше меняется только после фиксации
+    транзакции писателя.
+    """
+    def __init__(self, filename, profile="terminal"):
+        self.filename = filename
+        self.profile = profile
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.db = None
+        self.scheduler = None
+        self.sold = {}          # номер сеанса: множество проданных мест
+        self.layouts = {}       # номер сеанса: схема зала
+        self.queue = None
+        self.tasks = []
+        self.server = None
+
+    def run_db(self, func, *args):
+        """
+        Аргументы: функция, ее аргументы.
+        Выполняет функцию в потоке работы с БД, возвращает awaitable с результатом.
+        """
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def start(self, host=HOST, port=PORT):
+        """
+        Аргументы: адрес, порт (0 - любой свободный).
+        Подключает БД, запускает писателя, снятие брони и прием подключений.
+        Возвращает фактический порт сервера.
+        """
+        self.db = await self.run_db(dbw.connect_DB, self.filename, self.profile)
+        self.scheduler = await self.run_db(dbw.HoldScheduler, self.db)
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.ensure_future(self.writeLoop()),
+                      asyncio.ensure_future(self.reclaimLoop())]
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """
+        Останавливает прием подключений и фоновые задачи, закрывает БД.
+        """
+        self.server.close()
+        await self.server.wait_closed()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.run_db(self.db.close)
+        self.executor.shutdown()
+
+    async def occupancy(self, show):
+        """
+        Аргументы: номер сеанса.
+        Возвращает множество проданных мест сеанса из памяти.
+        """
+        sold = self.sold.get(show)
+        if sold is None:
+            sold = self.sold.setdefault(show, await self.run_db(dbw.occupancy, show, self.db))
+        return sold
+
+    async def layout(self, show):
+        """
+        Аргументы: номер сеанса.
+        Возвращает схему зала сеанса, при промахе загружает ее из БД.
+        """
+        layout = self.layouts.get(show)
+        if layout is None:
+            layout = self.layouts.setdefault(show, await self.run_db(dbw.show_layout, show, self.db))
+        return layout
+
+    async def write(self, op, request):
+        """
+        Аргументы: операция, запрос.
+        Ставит запрос на запись в очередь писателя и ждет фиксации транзакции.
+        Заведомо невыполнимые продажи и возвраты отклоняются по памяти без записи,
+        запрос без обязательных полей или с полями не того типа - с KeyError
+        или TypeError, продажа или бронь мест не из схемы зала сеанса и день
+        не в формате ГГГГ-ММ-ДД - с ValueError до постановки в очередь.
+        """
+        for field in REQUIRED[op]:
+            if field not in request:
+                raise KeyError(field)
+        numbers = [request[field] for field in ("show", "seat", "price") if field in request]
+        numbers += request.get("seats", [])
+        if not isinstance(request.get("seats", []), list) or \
+           not all(isinstance(value, int) and not isinstance(value, bool) for value in numbers):
+            raise TypeError("show, seat, seats and price must be integers")
+        if op == "day":
+            if not isinstance(request["date"], str):
+                raise TypeError("date must be a YYYY-MM-DD string")
+            request["date"] = str(datetime.datetime.strptime(request["date"], "%Y-%m-%d").date())
+        show = request.get("show")
+        if op in ("sell", "hold"):
+            index = (await self.layout(show)).index
+            seats = request["seats"] if op == "sell" else [request["seat"]]
+            unknown = [seatNo for seatNo in seats if seatNo not in index]
+            if unknown:
+                raise ValueError("seats {0} are not in the hall of show {1}".format(unknown, show))
+        if op in ("sell", "return"):
+            sold = await self.occupancy(show)
+            seats = request["seats"]
+            if op == "sell" and not sold.isdisjoint(seats):
+                return False
+            if op == "return" and not sold.issuperset(seats):
+                return False
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((op, request, future))
+        return await future
+
+    async def writeLoop(self):
+        """
+        Писатель: забирает из очереди все накопившиеся запросы и выполняет их
+        одной транзакцией, затем обновляет занятость в памяти и отвечает.
+        """
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < GROUP_MAX and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                results = await self.run_db(self.commit, batch)
+            except Exception as err:    # писатель не должен останавливаться ни на каком запросе
+                for op, request, future in batch:
+                    if not future.done():
+                        future.set_exception(err)
+                continue
+            for (op, request, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    if not future.done():
+                        future.set_exception(result)
+                    continue
+                sold = self.sold.get(request.get("show"))
+                if result and sold is not None and op == "sell":
+                    sold.update(request["seats"])
+                elif result and sold is not None and op == "return":
+                    sold.difference_update(request["seats"])
+                if not future.done():
+                    future.set_result(result)
+
+    def commit(self, batch):
+        """
+        Аргументы: список запросов на запись.
+        Выполняется в потоке БД. Каждый запрос выполняется в своей точке
+        сохранения, неудачный откатывается, не затрагивая остальные.
+        Возвращает список результатов в порядке запросов, для ошибочного
+        запроса результат - исключение.
+        """
+        results = []
+        soldAt, now = str(datetime.datetime.now()), time.time()
+        scheduled = []
+        with dbw.transaction(self.db) as cursor:
+            for op, request, future in batch:
+                cursor.execute("SAVEPOINT request")
+                try:
+                    result = self.apply(op, request, cursor, soldAt, now)
+                except sqlite3.IntegrityError:
+                    result = False
+                except (KeyError, TypeError, ValueError,
+                        sqlite3.ProgrammingError, sqlite3.InterfaceError) as err:
+                    result = err    # ошибка в самом запросе - отказ только ему
+                if not result or isinstance(result, Exception):
+                    cursor.execute("ROLLBACK TO request")
+                cursor.execute("RELEASE request")
+                if isinstance(result, Exception):
+                    results.append(result)
+                    continue
+                if op == "hold":
+                    result = result or None
+                    if result:
+                        scheduled.append((result, request["show"], request["seat"]))
+                results.append(result)
+        for expires, show, seatNo in scheduled:
+            self.scheduler.schedule(expires, show, seatNo)
+        return results
+
+    def apply(self, op, request, cursor, soldAt, now):
+        """
+        Аргументы: операция, запрос, курсор, время продажи, текущее время.
+        Выполняет один запрос на запись внутри транзакции писателя.
+        """
+        if op == "day":
+            return dbw._add_day(request["date"], request["price"], cursor)
+        show = request["show"]
+        operator = request.get("operator")
+        if op == "sell":
+            dbw._sell_seats(request["seats"], show, request["price"], operator,
+                            cursor, soldAt, now)
+            return True
+        if op == "return":
+            dbw._return_seats(request["seats"], show, cursor)
+            return True
+        if op == "hold":
+            expires = now + request.get("ttl", dbw.HOLD_TTL)
+            if dbw._hold_seat(request["seat"], show, operator, expires, cursor, now):
+                return expires
+            return False
+        return dbw._release_seat(request["seat"], show, operator, cursor)
+
+    async def reclaimLoop(self):
+        """
+        Периодически снимает просроченную бронь в потоке БД.
+        """
+        while True:
+            await asyncio.sleep(RECLAIM_EVERY)
+            await self.run_db(self.reclaim)
+
+    def reclaim(self):
+        """
+        Снимает просроченную бронь, если она есть. Выполняется в потоке БД.
+        """
+        expiry = self.scheduler.next_expiry()
+        if expiry is not None and expiry <= time.time():
+            self.scheduler.reclaim()
+
+    async def dispatch(self, request):
+        """
+        Аргументы: запрос.
+        Выполняет запрос и возвращает его результат.
+        """
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+        op = request.get("op")
+        if op in WRITES:
+            return await self.write(op, request)
+        if op == "occupancy":
+            return sorted(await self.occupancy(request["show"]))
+        if op == "isVacancy":
+            return request["seat"] in await self.occupancy(request["show"])
+        if op == "holds":
+            holds = await self.run_db(dbw.holds, request["show"], self.db)
+            return [[seat, operator] for seat, operator in holds.items()]
+        raise ValueError("unknown op {0!r}".format(op))
+
+    async def handle(self, reader, writer):
+        """
+        Обслуживание одного подключения: запросы выполняются по порядку.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = {"result": await self.dispatch(json.loads(line))}
+                except (ValueError, KeyError, TypeError, sqlite3.Error) as err:
+                    response = {"error": "{0}: {1}".format(type(err).__name__, err)}
+                writer.write(json.dumps(response).encode("utf8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class BookingClient:
+    """
+    Клиент сервера продажи билетов для кассы. Повторяет методы OccupancyCache
+    и HoldScheduler, поэтому приложение может работать с ним вместо них.
+    """
+    def __init__(self, host=HOST, port=PORT, timeout=10):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.file = self.sock.makefile("rwb")
+
+    def request(self, op, **args):
+        """
+        Аргументы: операция, параметры запроса.
+        Отправляет запрос и возвращает результат, при ошибке на сервере
+        возбуждает BookingError.
+        """
+        args["op"] = op
+        self.file.write(json.dumps(args).encode("utf8") + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("booking server closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise BookingError(response["error"])
+        return response["result"]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def new_day(self, date, price):
+        return self.request("day", date=str(date), price=price)
+
+    def occupancy(self, show):
+        return set(self.request("occupancy", show=show))
+
+    def isVacancy(self, seatNo, show):
+        return self.request("isVacancy", seat=seatNo, show=show)
+
+    def sell_seat(self, seatNo, show, price, operator=None):
+        return self.sell_seats([seatNo], show, price, operator)
+
+    def sell_seats(self, seats, show, price, operator=None):
+        return self.request("sell", seats=list(seats), show=show, price=price, operator=operator)
+
+    def return_seat(self, seatNo, show):
+        return self.return_seats([seatNo], show)
+
+    def return_seats(self, seats, show):
+        return self.request("return", seats=list(seats), show=show)
+
+    def hold_seat(self, seatNo, show, operator=None, ttl=dbw.HOLD_TTL):
+        return self.request("hold", seat=seatNo, show=show, operator=operator, ttl=ttl)
+
+    def release_seat(self, seatNo, show, operator=None):
+        return self.request("release", seat=seatNo, show=show, operator=operator)
+
+    def holds(self, show):
+        return dict(self.request("holds", show=show))
+
+    def next_expiry(self):
+        """
+        Просроченную бронь снимает сервер, у клиента очереди снятия нет.
+        """
+        return None
+
+    def reclaim(self, now=None):
+        return set()
+
+
+async def serve(filename, host=HOST, port=PORT, profile="terminal"):
+    """
+    Аргументы: файл БД, адрес, порт, профиль подключения.
+    Запускает сервер и обслуживает кассы до прерывания.
+    """
+    server = BookingServer(filename, profile)
+    port = await server.start(host, port)
+    print("Booking server on {0}:{1}, DB {2}".format(host, port, filename))
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сервер продажи билетов кинотеатра.")
+    parser.add_argument("filename", nargs="?", default="CinemaDB.db", help="файл БД")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--profile", default="terminal", choices=sorted(dbw.PROFILES))
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.filename, args.host, args.port, args.profile))
+    except KeyboardInterrupt:
+        pass
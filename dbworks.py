@@ -13,9 +13,15 @@
 
     if db is not None:
             db.close()
+
+Запущенный из консоли модуль выполняет команды администрирования
+с результатом в JSON, без команды - открывает интерактивное меню:
+
+    python dbworks.py --db CinemaDB.db report 2024-01-01 2024-01-31
 """
 
-import sqlite3, os, datetime, random
+import sqlite3, os, sys, datetime, time, random, contextlib, threading, collections, functools, heapq, \
+       json, csv, re, inspect, argparse
 
 file = "tmpdb.mdl"
 MENU = "Choose menu item:\n" + \
@@ -25,282 +31,1888 @@ MENU = "Choose menu item:\n" + \
        "4. Report by sales\n" + \
        "5. Show all db\n" + \
        "6. Sell random tickets for today's sessions\n" + \
-       "7. Quit\n\n"
-SESSIONS = ("Session10", "Session12", "Session14", "Session16")
+       "7. Check daily summary\n" + \
+       "8. Quit\n\n"
+DEFAULT_SCHEDULE = ("10:00", "12:00", "14:00", "16:00")  # сеансы нового дня в зале 1
+DEFAULT_DURATION = 120  # продолжительность сеанса по умолчанию, мин
+SALE_CLOSE = 10         # продажа и возврат закрываются за столько минут до конца сеанса
+HOLD_TTL = 300          # время брони места по умолчанию, сек
+# Миграции схемы БД. Номер версии схемы хранится в PRAGMA user_version,
+# миграция с номером N переводит базу из версии N-1 в версию N.
+MIGRATIONS = (
+    # 1: составные индексы по дате и месту для поиска без полного перебора
+    "CREATE INDEX IF NOT EXISTS SeatsDateSeat ON Seats(RecDate, SeatCode); \
+     CREATE INDEX IF NOT EXISTS SalesDateSeat ON Sales(RecDate, SeatCode);",
+    # 2: переход от широких таблиц Seats/Sales (строка на место в день) к
+    # таблице билетов Tickets (строка на проданный билет) и таблице дней Days
+    "CREATE TABLE Days ( \
+         date TEXT PRIMARY KEY NOT NULL, \
+         price INTEGER); \
+     CREATE TABLE Tickets ( \
+         RecNo INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL, \
+         date TEXT NOT NULL, \
+         session TEXT NOT NULL, \
+         seat INTEGER NOT NULL, \
+         price INTEGER DEFAULT 0, \
+         sold_at TEXT, \
+         operator TEXT, \
+         UNIQUE (date, session, seat)); \
+     INSERT OR IGNORE INTO Days(date) SELECT RecDate FROM Seats; \
+     INSERT OR IGNORE INTO Tickets(date, session, seat, price) \
+         SELECT s.RecDate, 'Session10', s.SeatCode, COALESCE(p.Session10, 0) \
+         FROM Seats s LEFT JOIN Sales p ON p.RecDate=s.RecDate AND p.SeatCode=s.SeatCode \
+         WHERE s.Session10>0 \
+         UNION ALL \
+         SELECT s.RecDate, 'Session12', s.SeatCode, COALESCE(p.Session12, 0) \
+         FROM Seats s LEFT JOIN Sales p ON p.RecDate=s.RecDate AND p.SeatCode=s.SeatCode \
+         WHERE s.Session12>0 \
+         UNION ALL \
+         SELECT s.RecDate, 'Session14', s.SeatCode, COALESCE(p.Session14, 0) \
+         FROM Seats s LEFT JOIN Sales p ON p.RecDate=s.RecDate AND p.SeatCode=s.SeatCode \
+         WHERE s.Session14>0 \
+         UNION ALL \
+         SELECT s.RecDate, 'Session16', s.SeatCode, COALESCE(p.Session16, 0) \
+         FROM Seats s LEFT JOIN Sales p ON p.RecDate=s.RecDate AND p.SeatCode=s.SeatCode \
+         WHERE s.Session16>0; \
+     DROP TABLE Seats; \
+     DROP TABLE Sales;",
+    # 3: сводка продаж по дням и сеансам, поддерживается триггерами на Tickets
+    "CREATE TABLE DailySummary ( \
+         date TEXT NOT NULL, \
+         session TEXT NOT NULL, \
+         seats_sold INTEGER NOT NULL DEFAULT 0, \
+         revenue INTEGER NOT NULL DEFAULT 0, \
+         PRIMARY KEY (date, session)); \
+     CREATE TRIGGER TicketSold AFTER INSERT ON Tickets BEGIN \
+         INSERT INTO DailySummary(date, session, seats_sold, revenue) \
+         VALUES (NEW.date, NEW.session, 1, COALESCE(NEW.price, 0)) \
+         ON CONFLICT(date, session) DO UPDATE \
+         SET seats_sold = seats_sold + 1, revenue = revenue + excluded.revenue; \
+     END; \
+     CREATE TRIGGER TicketReturned AFTER DELETE ON Tickets BEGIN \
+         UPDATE DailySummary \
+         SET seats_sold = seats_sold - 1, revenue = revenue - COALESCE(OLD.price, 0) \
+         WHERE date = OLD.date AND session = OLD.session; \
+     END; \
+     CREATE TRIGGER TicketChanged AFTER UPDATE OF date, session, price ON Tickets BEGIN \
+         UPDATE DailySummary \
+         SET seats_sold = seats_sold - 1, revenue = revenue - COALESCE(OLD.price, 0) \
+         WHERE date = OLD.date AND session = OLD.session; \
+         INSERT INTO DailySummary(date, session, seats_sold, revenue) \
+         VALUES (NEW.date, NEW.session, 1, COALESCE(NEW.price, 0)) \
+         ON CONFLICT(date, session) DO UPDATE \
+         SET seats_sold = seats_sold + 1, revenue = revenue + excluded.revenue; \
+     END; \
+     INSERT INTO DailySummary(date, session, seats_sold, revenue) \
+         SELECT date, session, COUNT(*), COALESCE(SUM(price), 0) \
+         FROM Tickets GROUP BY date, session;",
+    # 4: схемы залов
+    "CREATE TABLE Halls ( \
+         hall INTEGER PRIMARY KEY NOT NULL, \
+         name TEXT, \
+         layout TEXT NOT NULL);",
+    # 5: расписание сеансов Shows, билеты и сводка привязываются к номеру сеанса
+    # вместо имени колонки. Прежние сеансы Session10..Session16 становятся
+    # сеансами 10:00..16:00 в зале 1 на каждый зарегистрированный день.
+    "CREATE TABLE Shows ( \
+         show INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, \
+         date TEXT NOT NULL, \
+         hall INTEGER NOT NULL DEFAULT 1, \
+         start TEXT NOT NULL, \
+         duration INTEGER NOT NULL DEFAULT 120, \
+         film TEXT, \
+         sale_until TEXT NOT NULL, \
+         UNIQUE (date, hall, start)); \
+     CREATE INDEX ShowsSaleUntil ON Shows(date, sale_until); \
+     INSERT OR IGNORE INTO Days(date) SELECT date FROM Tickets; \
+     INSERT INTO Shows(date, hall, start, duration, sale_until) \
+         SELECT d.date, 1, s.start, 120, s.sale_until \
+         FROM Days d, (SELECT '10:00' AS start, '11:50' AS sale_until \
+                       UNION ALL SELECT '12:00', '13:50' \
+                       UNION ALL SELECT '14:00', '15:50' \
+                       UNION ALL SELECT '16:00', '17:50') s \
+         ORDER BY d.date, s.start; \
+     CREATE TABLE NewTickets ( \
+         RecNo INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL, \
+         show INTEGER NOT NULL, \
+         date TEXT NOT NULL, \
+         seat INTEGER NOT NULL, \
+         price INTEGER DEFAULT 0, \
+         sold_at TEXT, \
+         operator TEXT, \
+         UNIQUE (show, seat)); \
+     INSERT INTO NewTickets(RecNo, show, date, seat, price, sold_at, operator) \
+         SELECT t.RecNo, sh.show, t.date, t.seat, t.price, t.sold_at, t.operator \
+         FROM Tickets t JOIN Shows sh \
+         ON sh.date=t.date AND sh.hall=1 AND sh.start=substr(t.session, 8) || ':00'; \
+     DROP TABLE Tickets; \
+     ALTER TABLE NewTickets RENAME TO Tickets; \
+     CREATE INDEX TicketsDate ON Tickets(date); \
+     DROP TABLE DailySummary; \
+     CREATE TABLE DailySummary ( \
+         show INTEGER PRIMARY KEY NOT NULL, \
+         date TEXT NOT NULL, \
+         seats_sold INTEGER NOT NULL DEFAULT 0, \
+         revenue INTEGER NOT NULL DEFAULT 0); \
+     CREATE INDEX DailySummaryDate ON DailySummary(date); \
+     CREATE TRIGGER TicketSold AFTER INSERT ON Tickets BEGIN \
+         INSERT INTO DailySummary(show, date, seats_sold, revenue) \
+         VALUES (NEW.show, NEW.date, 1, COALESCE(NEW.price, 0)) \
+         ON CONFLICT(show) DO UPDATE \
+         SET seats_sold = seats_sold + 1, revenue = revenue + excluded.revenue; \
+     END; \
+     CREATE TRIGGER TicketReturned AFTER DELETE ON Tickets BEGIN \
+         UPDATE DailySummary \
+         SET seats_sold = seats_sold - 1, revenue = revenue - COALESCE(OLD.price, 0) \
+         WHERE show = OLD.show; \
+     END; \
+     CREATE TRIGGER TicketChanged AFTER UPDATE OF show, date, price ON Tickets BEGIN \
+         UPDATE DailySummary \
+         SET seats_sold = seats_sold - 1, revenue = revenue - COALESCE(OLD.price, 0) \
+         WHERE show = OLD.show; \
+         INSERT INTO DailySummary(show, date, seats_sold, revenue) \
+         VALUES (NEW.show, NEW.date, 1, COALESCE(NEW.price, 0)) \
+         ON CONFLICT(show) DO UPDATE \
+         SET seats_sold = seats_sold + 1, revenue = revenue + excluded.revenue; \
+     END; \
+     INSERT INTO DailySummary(show, date, seats_sold, revenue) \
+         SELECT show, date, COUNT(*), COALESCE(SUM(price), 0) \
+         FROM Tickets GROUP BY show;",
+    # 6: временная бронь мест, expires - время окончания брони в секундах эпохи
+    "CREATE TABLE Holds ( \
+         show INTEGER NOT NULL, \
+         seat INTEGER NOT NULL, \
+         operator TEXT, \
+         expires REAL NOT NULL, \
+         PRIMARY KEY (show, seat)) WITHOUT ROWID;",
+    # 7: номер последней записи журнала отложенной записи, перенесенной в базу
+    "CREATE TABLE JournalState ( \
+         journal TEXT PRIMARY KEY NOT NULL, \
+         seq INTEGER NOT NULL);",
+    # 8: перечень закрытых месяцев, перенесенных в архивные базы
+    "CREATE TABLE Archives ( \
+         month TEXT PRIMARY KEY NOT NULL, \
+         filename TEXT NOT NULL);",
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
 
+# Профили подключения к БД: режим журнала, уровень синхронизации с диском
+# и время ожидания блокировки в мс. Режим WAL позволяет читать базу во время
+# записи с другого подключения, но работает только для файла на локальном
+# диске - для базы в сетевой папке нужен профиль "legacy".
+PROFILES = {
+    # кассовый терминал: чтение не блокирует продажи, fsync только на контрольных точках
+    "terminal": {"journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 5000},
+    # максимальная надежность: fsync на каждой транзакции
+    "safe": {"journal_mode": "WAL", "synchronous": "FULL", "busy_timeout": 10000},
+    # массовая загрузка данных и обслуживание базы
+    "bulk": {"journal_mode": "WAL", "synchronous": "OFF", "busy_timeout": 30000},
+    # прежний режим с журналом отката, для сетевых папок и для сравнения
+    "legacy": {"journal_mode": "DELETE", "synchronous": "FULL", "busy_timeout": 5000},
+}
 
-def connect_DB(filename):
+
+def connect_DB(filename, profile="terminal"):
     """
-    Аргументы: БД
+    Аргументы: БД, профиль подключения из PROFILES.
     Подключение базы данных, если указанный файл отсутствует,
-    то создание пустой базы данных из двух таблиц.
+    то создание пустой базы данных. Схема базы приводится к актуальной версии.
     """
-    create = not os.path.exists(filename)
-    db = sqlite3.connect(filename)
-    if create:
-        # если файла БД не существует - создаем новый
-        cursor = db.cursor()
-        cursor.execute("CREATE TABLE Seats ( \
-                       RecNo INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL, \
-                       SeatCode INTEGER NOT NULL, \
-                       Session10 INTEGER DEFAULT 0, \
-                       Session12 INTEGER DEFAULT 0, \
-                       Session14 INTEGER DEFAULT 0, \
-                       Session16 INTEGER DEFAULT 0, \
-                       RecDate TEXT NOT NULL)")
-        db.commit()
-        cursor.execute("CREATE TABLE Sales ( \
-                       RecNo INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL, \
-                       RecDate TEXT NOT NULL, \
-                       SeatCode INTEGER NOT NULL, \
-                       Session10 INTEGER DEFAULT 0, \
-                       Session12 INTEGER DEFAULT 0, \
-                       Session14 INTEGER DEFAULT 0, \
-                       Session16 INTEGER DEFAULT 0)")
-        db.commit()
+    settings = PROFILES[profile]
+    db = sqlite3.connect(filename, check_same_thread=False)
+    db.execute("PRAGMA busy_timeout = {0:d}".format(settings["busy_timeout"]))
+    db.execute("PRAGMA journal_mode = {0}".format(settings["journal_mode"]))
+    db.execute("PRAGMA synchronous = {0}".format(settings["synchronous"]))
+    with transaction(db) as cursor:
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master")
+        if not cursor.fetchone()[0]:
+            # если база пустая - создаем исходные таблицы, дальше их обновят миграции
+            cursor.execute("CREATE TABLE Seats ( \
+                           RecNo INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL, \
+                           SeatCode INTEGER NOT NULL, \
+                           Session10 INTEGER DEFAULT 0, \
+                           Session12 INTEGER DEFAULT 0, \
+                           Session14 INTEGER DEFAULT 0, \
+                           Session16 INTEGER DEFAULT 0, \
+                           RecDate TEXT NOT NULL)")
+            cursor.execute("CREATE TABLE Sales ( \
+                           RecNo INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL, \
+                           RecDate TEXT NOT NULL, \
+                           SeatCode INTEGER NOT NULL, \
+                           Session10 INTEGER DEFAULT 0, \
+                           Session12 INTEGER DEFAULT 0, \
+                           Session14 INTEGER DEFAULT 0, \
+                           Session16 INTEGER DEFAULT 0)")
+    migrate_DB(db)
+    if TRACER is not None:
+        TRACER.attach(db)
     return db
 
-def isVacancy(seatNo, session, date, db):
+def schema_version(db):
+    """
+    Аргументы: БД.
+    Возвращает номер версии схемы БД.
+    """
+    cursor = db.cursor()
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0]
+
+def migrate_DB(db):
+    """
+    Аргументы: БД.
+    Приведение схемы БД к актуальной версии SCHEMA_VERSION. Каждая миграция
+    выполняется в отдельной транзакции вместе с записью нового номера версии,
+    поэтому прерванное обновление не оставляет базу в промежуточном состоянии.
+    Если ту же миграцию одновременно выполнил другой терминал, она пропускается.
+    Возвращает номер версии схемы после обновления.
+    """
+    cursor = db.cursor()
+    version = schema_version(db)
+    for number in range(version + 1, SCHEMA_VERSION + 1):
+        try:
+            cursor.executescript("BEGIN IMMEDIATE; {0} PRAGMA user_version = {1}; COMMIT;".format(
+                                 MIGRATIONS[number - 1], number))
+        except sqlite3.OperationalError:
+            db.rollback()
+            if schema_version(db) < number:
+                raise
+        version = number
+    return version
+
+
+class ConnectionManager:
+    """
+    Менеджер подключений к общей базе нескольких кассовых терминалов.
+    Каждый поток получает собственное подключение с настройками профиля,
+    подключения открываются при первом обращении потока.
+    """
+    def __init__(self, filename, profile="terminal"):
+        self.filename = filename
+        self.profile = profile
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def connection(self):
+        """
+        Возвращает подключение к БД для текущего потока.
+        """
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = connect_DB(self.filename, self.profile)
+            self.local.db = db
+            with self.lock:
+                self.connections.append(db)
+        return db
+
+    def close(self):
+        """
+        Закрывает все открытые подключения.
+        """
+        with self.lock:
+            for db in self.connections:
+                db.close()
+            self.connections = []
+        self.local = threading.local()
+
+def isVacancy(seatNo, show, db):
     """
-    Аргументы: номер места, сеанс, дата, БД.
-    Проверка занятости места, если свобовдно - возвращает True, занято - False
+    Аргументы: номер места, номер сеанса, БД.
+    Проверка занятости места, если место продано - возвращает True, свободно - False
     """
     cursor = db.cursor()
-    # проверяем наличие записей на указанную дату
     sql = "SELECT RecNo \
-           FROM Seats \
-           WHERE RecDate={0} AND SeatCode={1} AND {2}>0".format(date,
-                                                                seatNo,
-                                                                session)
-    cursor.execute(sql)
-    day_flag = False
-    for record in cursor:
-        day_flag = True
-    return day_flag
-
-def sell_seat(seatNo, session, date, price, db):
-    """
-    Аргументы: номер места, сеанс, дата, цена билета, БД.
-    Процедура продажи места в зале.     
-    """
-    cursor = db.cursor()    
-    # записываем флаг 1 в таблицу мест для указанного места в указанный сеанс и день
-    sql = "UPDATE Seats \
-           SET {1} = 1 \
-           WHERE (SeatCode={0}) AND (RecDate={2})".format(seatNo,
-                                                          session,
-                                                          date)
-    cursor.execute(sql)
-    db.commit()
-    # записываем цену билета в таблицу продаж для указанного места в указанный сеанс и день
-    sql = "UPDATE Sales \
-           SET {1} = {3} \
-           WHERE (SeatCode={0}) AND (RecDate={2})".format(seatNo,
-                                                          session,
-                                                          date,
-                                                          price)
-    cursor.execute(sql)
-    db.commit()
+           FROM Tickets \
+           WHERE show=? AND seat=?"
+    cursor.execute(sql, (show, seatNo))
+    return cursor.fetchone() is not None
 
-def return_seat(seatNo, session, date, db):
+def occupancy(show, db):
     """
-    Аргументы: номер места, сеанс, дата, БД.
-    Процедура возврата проданного места.     
+    Аргументы: номер сеанса, БД.
+    Карта занятости зала на сеанс одним запросом, возвращает множество
+    номеров проданных мест.
     """
-    cursor = db.cursor()    
-    # записываем флаг 0 в таблицу мест для указанного места в указанный сеанс и день
-    sql = "UPDATE Seats \
-           SET {1} = 0 \
-           WHERE (SeatCode={0}) AND (RecDate={2})".format(seatNo,
-                                                          session,
-                                                          date)
-    cursor.execute(sql)
-    db.commit()
-    # обнуляем цену билета в таблицу продаж для указанного места в указанный сеанс и день
-    sql = "UPDATE Sales \
-           SET {1} = 0 \
-           WHERE (SeatCode={0}) AND (RecDate={2})".format(seatNo,
-                                                          session,
-                                                          date)
-    cursor.execute(sql)
+    cursor = db.cursor()
+    sql = "SELECT seat \
+           FROM Tickets \
+           WHERE show=?"
+    cursor.execute(sql, (show,))
+    return {record[0] for record in cursor}
+
+@contextlib.contextmanager
+def transaction(db):
+    """
+    Аргументы: БД.
+    Контекст транзакции BEGIN IMMEDIATE: блокировка на запись берется сразу,
+    при выходе из блока - COMMIT, при исключении - ROLLBACK.
+    Возвращает курсор для работы внутри транзакции.
+    """
+    cursor = db.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        yield cursor
+    except:
+        db.rollback()
+        raise
     db.commit()
 
+# продажа места, если на него нет действующей брони другого оператора
+SELL_SQL = "INSERT OR IGNORE INTO Tickets(show, date, seat, price, sold_at, operator) \
+            SELECT show, date, ?1, ?2, ?3, ?4 FROM Shows \
+            WHERE show=?5 AND NOT EXISTS (SELECT 1 FROM Holds h \
+                WHERE h.show=?5 AND h.seat=?1 AND h.expires>?6 AND h.operator IS NOT ?4)"
+
+def sell_seat(seatNo, show, price, db, operator=None):
+    """
+    Аргументы: номер места, номер сеанса, цена билета, БД, оператор.
+    Процедура продажи места в зале. Билет записывается только если место есть
+    в схеме зала, еще свободно, не забронировано другим оператором и сеанс есть
+    в расписании. Бронь проданного места снимается.
+    Возвращает True при успешной продаже, False - если место уже продано.
+    """
+    if seatNo not in show_layout(show, db).index:
+        return False
+    with transaction(db) as cursor:
+        cursor.execute(SELL_SQL, (seatNo, price, str(datetime.datetime.now()), operator, show,
+                                  time.time()))
+        if cursor.rowcount != 1:
+            return False
+        cursor.execute("DELETE FROM Holds WHERE show=? AND seat=?", (show, seatNo))
+        return True
+
+def return_seat(seatNo, show, db):
+    """
+    Аргументы: номер места, номер сеанса, БД.
+    Процедура возврата проданного места, билет удаляется из таблицы билетов.
+    Возвращает True при успешном возврате, False - если место не было продано.
+    """
+    with transaction(db) as cursor:
+        sql = "DELETE FROM Tickets \
+               WHERE show=? AND seat=?"
+        cursor.execute(sql, (show, seatNo))
+        return cursor.rowcount == 1
+
+def _sell_seats(seats, show, price, operator, cursor, soldAt, now):
+    """
+    Аргументы: номера мест, номер сеанса, цена билета, оператор, курсор,
+    время продажи, текущее время (секунды эпохи).
+    Записывает билеты на все места и снимает их бронь. Транзакцию не завершает,
+    если хоть одно место недоступно или его нет в схеме зала - возбуждает
+    sqlite3.IntegrityError.
+    """
+    index = show_layout(show, cursor.connection).index
+    if not all(seatNo in index for seatNo in seats):
+        raise sqlite3.IntegrityError("seats of show {0} not in hall layout".format(show))
+    sql = SELL_SQL.replace("INSERT OR IGNORE", "INSERT")
+    cursor.executemany(sql, [(seatNo, price, soldAt, operator, show, now) for seatNo in seats])
+    if cursor.rowcount != len(seats):  # место в брони или сеанса нет в расписании
+        raise sqlite3.IntegrityError("seats of show {0} not available".format(show))
+    cursor.executemany("DELETE FROM Holds WHERE show=? AND seat=?",
+                       [(show, seatNo) for seatNo in seats])
+
+def _return_seats(seats, show, cursor):
+    """
+    Аргументы: номера мест, номер сеанса, курсор.
+    Удаляет билеты на все места. Транзакцию не завершает, если хоть одно
+    место не было продано - возбуждает sqlite3.IntegrityError.
+    """
+    sql = "DELETE FROM Tickets \
+           WHERE show=? AND seat=?"
+    cursor.executemany(sql, [(show, seatNo) for seatNo in seats])
+    if cursor.rowcount != len(seats):
+        raise sqlite3.IntegrityError("seats of show {0} not sold".format(show))
+
+def sell_seats(seats, show, price, db, operator=None):
+    """
+    Аргументы: номера мест, номер сеанса, цена билета, БД, оператор.
+    Групповая продажа мест одной транзакцией: продаются либо все места,
+    либо ни одного, если хоть одно место уже продано или забронировано
+    другим оператором.
+    Возвращает True при успешной продаже, False - если продажа отменена.
+    """
+    try:
+        with transaction(db) as cursor:
+            _sell_seats(list(seats), show, price, operator, cursor,
+                        str(datetime.datetime.now()), time.time())
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+def return_seats(seats, show, db):
+    """
+    Аргументы: номера мест, номер сеанса, БД.
+    Групповой возврат мест одной транзакцией: возвращаются либо все места,
+    либо ни одного, если хоть одно место не было продано.
+    Возвращает True при успешном возврате, False - если возврат отменен.
+    """
+    try:
+        with transaction(db) as cursor:
+            _return_seats(list(seats), show, cursor)
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+def _hold_seat(seatNo, show, operator, expires, cursor, now):
+    """
+    Аргументы: номер места, номер сеанса, оператор, окончание брони, курсор,
+    текущее время (секунды эпохи).
+    Записывает или продлевает бронь места. Транзакцию не завершает.
+    Возвращает True, если бронь записана.
+    """
+    sql = "INSERT INTO Holds(show, seat, operator, expires) \
+           SELECT ?1, ?2, ?3, ?4 \
+           WHERE NOT EXISTS (SELECT 1 FROM Tickets WHERE show=?1 AND seat=?2) \
+           ON CONFLICT(show, seat) DO UPDATE \
+           SET operator=excluded.operator, expires=excluded.expires \
+           WHERE expires<=?5 OR operator IS excluded.operator"
+    cursor.execute(sql, (show, seatNo, operator, expires, now))
+    return cursor.rowcount == 1
+
+def _release_seat(seatNo, show, operator, cursor):
+    """
+    Аргументы: номер места, номер сеанса, оператор, курсор.
+    Удаляет бронь оператора. Транзакцию не завершает.
+    Возвращает True, если бронь была снята.
+    """
+    cursor.execute("DELETE FROM Holds WHERE show=? AND seat=? AND operator IS ?",
+                   (show, seatNo, operator))
+    return cursor.rowcount == 1
+
+def hold_seat(seatNo, show, db, operator=None, ttl=HOLD_TTL):
+    """
+    Аргументы: номер места, номер сеанса, БД, оператор, время брони в секундах.
+    Бронирует свободное место на время ttl. Свою бронь оператор может продлить,
+    чужую - только после ее окончания.
+    Возвращает время окончания брони (секунды эпохи) или None, если место
+    продано или забронировано другим оператором.
+    """
+    now = time.time()
+    expires = now + ttl
+    with transaction(db) as cursor:
+        return expires if _hold_seat(seatNo, show, operator, expires, cursor, now) else None
+
+def release_seat(seatNo, show, db, operator=None):
+    """
+    Аргументы: номер места, номер сеанса, БД, оператор.
+    Снимает бронь оператора с места. Возвращает True, если бронь была снята.
+    """
+    with transaction(db) as cursor:
+        return _release_seat(seatNo, show, operator, cursor)
+
+def holds(show, db, now=None):
+    """
+    Аргументы: номер сеанса, БД, текущее время (секунды эпохи).
+    Действующая бронь на сеанс, возвращает словарь номер места: оператор.
+    """
+    cursor = db.cursor()
+    sql = "SELECT seat, operator \
+           FROM Holds \
+           WHERE show=? AND expires>?"
+    cursor.execute(sql, (show, time.time() if now is None else now))
+    return dict(cursor.fetchall())
+
+class HoldScheduler:
+    """
+    Планировщик снятия просроченной брони. Окончания броней этого подключения
+    хранятся в куче, reclaim по таймеру снимает только просроченные - без
+    просмотра всей таблицы. Бронь проверяется по времени окончания и при
+    чтении, поэтому просроченная, но еще не снятая бронь места не держит.
+    """
+    def __init__(self, db):
+        self.db = db
+        cursor = db.cursor()
+        cursor.execute("SELECT expires, show, seat FROM Holds")
+        self.heap = cursor.fetchall()
+        heapq.heapify(self.heap)
+
+    def hold_seat(self, seatNo, show, operator=None, ttl=HOLD_TTL):
+        """
+        Аргументы: номер места, номер сеанса, оператор, время брони в секундах.
+        Бронь места через БД с постановкой в очередь снятия. Возвращает результат hold_seat.
+        """
+        expires = hold_seat(seatNo, show, self.db, operator, ttl)
+        if expires is not None:
+            self.schedule(expires, show, seatNo)
+        return expires
+
+    def schedule(self, expires, show, seatNo):
+        """
+        Аргументы: окончание брони, номер сеанса, номер места.
+        Ставит бронь, записанную в БД в обход hold_seat, в очередь снятия.
+        """
+        heapq.heappush(self.heap, (expires, show, seatNo))
+
+    def release_seat(self, seatNo, show, operator=None):
+        """
+        Аргументы: номер места, номер сеанса, оператор.
+        Снимает бронь сразу, запись в куче отбрасывается при ее окончании.
+        """
+        return release_seat(seatNo, show, self.db, operator)
+
+    def next_expiry(self):
+        """
+        Возвращает ближайшее время окончания брони или None, если брони нет.
+        """
+        return self.heap[0][0] if self.heap else None
+
+    def reclaim(self, now=None):
+        """
+        Аргументы: текущее время (секунды эпохи).
+        Снимает просроченную бронь одной транзакцией.
+        Возвращает множество номеров сеансов, на которых освободились места.
+        """
+        now = time.time() if now is None else now
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            expires, show, seat = heapq.heappop(self.heap)
+            expired.append((show, seat, now))
+        if not expired:
+            return set()
+        # продленная бронь имеет более позднее окончание и не удаляется
+        with transaction(self.db) as cursor:
+            cursor.executemany("DELETE FROM Holds WHERE show=? AND seat=? AND expires<=?", expired)
+        return {item[0] for item in expired}
+
+SEAT_MARK = "x"  # место в строке схемы зала, любой другой символ - проход
+
+
+class HallLayout:
+    """
+    Схема зала. Задается списком строк, каждая строка - ряд, символ SEAT_MARK -
+    место, любой другой символ - проход или пустое место. Места в ряду
+    нумеруются слева направо без учета проходов, номер места в БД - РЯД*100+МЕСТО.
+    Каждому месту присваивается компактный индекс 0..N-1, для индекса заранее
+    рассчитаны номер места, ряд, номер в ряду и колонка в сетке зала.
+    """
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.seats = []    # номер места в БД по индексу
+        self.row = []      # ряд по индексу
+        self.number = []   # номер места в ряду по индексу
+        self.column = []   # колонка в сетке зала по индексу
+        for r, line in enumerate(self.rows, start=1):
+            n = 0
+            for column, mark in enumerate(line):
+                if mark != SEAT_MARK:
+                    continue
+                n += 1
+                if n > 99:
+                    raise ValueError("Too many seats in row {0}".format(r))
+                self.seats.append(r * 100 + n)
+                self.row.append(r)
+                self.number.append(n)
+                self.column.append(column)
+        self.index = {seat: i for i, seat in enumerate(self.seats)}
+        self.width = max((len(line) for line in self.rows), default=0)
+
+    def __len__(self):
+        return len(self.seats)
+
+    def text(self):
+        """
+        Возвращает схему зала текстом, строка на ряд.
+        """
+        return "\n".join(self.rows)
+
+
+DEFAULT_HALL = HallLayout([SEAT_MARK * 10] * 10)  # зал 10 рядов по 10 мест
+
+
+@functools.lru_cache(maxsize=16)
+def parse_hall(text):
+    """
+    Аргументы: схема зала текстом.
+    Разбор схемы зала: пустые строки и строки, начинающиеся с #, пропускаются.
+    """
+    rows = [line.rstrip() for line in text.splitlines()]
+    return HallLayout([line for line in rows if line and not line.startswith("#")])
+
+def load_hall(filename):
+    """
+    Аргументы: файл со схемой зала.
+    Загрузка схемы зала из текстового файла.
+    """
+    with open(filename, encoding="utf8") as fh:
+        return parse_hall(fh.read())
+
+def save_hall(layout, db, hall=1, name=None):
+    """
+    Аргументы: схема зала, БД, номер зала, название зала.
+    Сохранение схемы зала в БД.
+    """
+    with transaction(db) as cursor:
+        cursor.execute("INSERT OR REPLACE INTO Halls(hall, name, layout) VALUES (?, ?, ?)",
+                       (hall, name, layout.text()))
+
+def get_hall(db, hall=1):
+    """
+    Аргументы: БД, номер зала.
+    Схема зала из БД, если зал не описан - схема по умолчанию DEFAULT_HALL.
+    """
+    cursor = db.cursor()
+    cursor.execute("SELECT layout FROM Halls WHERE hall=?", (hall,))
+    record = cursor.fetchone()
+    if record is None:
+        return DEFAULT_HALL
+    return parse_hall(record[0])
+
+def show_layout(show, db):
+    """
+    Аргументы: номер сеанса, БД.
+    Схема зала, в котором идет сеанс, одним запросом. Если сеанса нет или зал
+    не описан - схема по умолчанию DEFAULT_HALL.
+    """
+    cursor = db.cursor()
+    cursor.execute("SELECT h.layout FROM Shows s JOIN Halls h ON h.hall=s.hall WHERE s.show=?",
+                   (show,))
+    record = cursor.fetchone()
+    if record is None:
+        return DEFAULT_HALL
+    return parse_hall(record[0])
+
+def hall_seats(layout=DEFAULT_HALL):
+    """
+    Аргументы: схема зала.
+    Возвращает перечень номеров мест в зале в формате РЯД*100+МЕСТО.
+    """
+    return list(layout.seats)
+
+def _sale_until(start, duration):
+    """
+    Аргументы: начало сеанса ЧЧ:ММ, продолжительность в минутах.
+    Время окончания продажи билетов на сеанс ЧЧ:ММ, не позже конца суток.
+    """
+    hours, minutes = start.split(":")
+    until = min(int(hours) * 60 + int(minutes) + duration - SALE_CLOSE, 24 * 60 - 1)
+    return "{0:02d}:{1:02d}".format(until // 60, until % 60)
+
+def _is_archived(date, cursor):
+    """
+    Аргументы: дата, курсор.
+    Возвращает True, если месяц даты перенесен в архив.
+    """
+    cursor.execute("SELECT 1 FROM Archives WHERE month=?", (str(date)[:7],))
+    return cursor.fetchone() is not None
+
+def _add_day(date, price, cursor):
+    """
+    Аргументы: дата, цена билета, курсор.
+    Регистрирует день и, если на него нет ни одного сеанса, добавляет
+    расписание по умолчанию DEFAULT_SCHEDULE. Транзакцию не завершает.
+    Возвращает True, если день был добавлен.
+    """
+    if _is_archived(date, cursor):
+        return False    # день закрытого месяца уже есть в архиве
+    cursor.execute("INSERT OR IGNORE INTO Days(date, price) VALUES (?, ?)", (date, price))
+    if cursor.rowcount != 1:
+        return False
+    cursor.execute("SELECT show FROM Shows WHERE date=? LIMIT 1", (date,))
+    if cursor.fetchone() is None:
+        cursor.executemany("INSERT INTO Shows(date, hall, start, duration, sale_until) \
+                            VALUES (?, 1, ?, ?, ?)",
+                           [(date, start, DEFAULT_DURATION, _sale_until(start, DEFAULT_DURATION))
+                            for start in DEFAULT_SCHEDULE])
+    return True
+
 def new_day(date, price, db):
     """
     Аргументы: дата, цена билета, БД.
-    Если записи на указанную дату не существуют, то добавляем записи для каждого
-    места на эту дату. Все занчения полей по умолчанию.
+    Регистрирует день работы кассы с ценой билета, если он еще не зарегистрирован,
+    и создает на него расписание по умолчанию, если сеансы не заданы заранее.
+    Записи о местах не создаются - таблица билетов растет только с продажами.
+    """
+    with transaction(db) as cursor:
+        _add_day(str(date), price, cursor)
+
+def new_days(start, finish, price, db):
+    """
+    Аргументы: первый день, последний день (datetime.date), цена билета, БД.
+    Регистрирует каждый день диапазона включительно, который еще не
+    зарегистрирован. Весь диапазон добавляется в одной транзакции.
+    Возвращает кол-во добавленных дней.
+    """
+    added = 0
+    with transaction(db) as cursor:
+        for n in range((finish - start).days + 1):
+            if _add_day(str(start + datetime.timedelta(n)), price, cursor):
+                added += 1
+    return added
+
+def add_show(date, start, db, hall=1, duration=DEFAULT_DURATION, film=None):
+    """
+    Аргументы: дата, начало ЧЧ:ММ, БД, номер зала, продолжительность в минутах, фильм.
+    Добавляет сеанс в расписание, возвращает номер сеанса.
+    В месяц, перенесенный в архив, сеансы не добавляются (ValueError).
+    """
+    with transaction(db) as cursor:
+        if _is_archived(date, cursor):
+            raise ValueError("month {0} is archived".format(str(date)[:7]))
+        cursor.execute("INSERT OR IGNORE INTO Days(date) VALUES (?)", (str(date),))
+        cursor.execute("INSERT INTO Shows(date, hall, start, duration, film, sale_until) \
+                        VALUES (?, ?, ?, ?, ?, ?)",
+                       (str(date), hall, start, duration, film, _sale_until(start, duration)))
+        return cursor.lastrowid
+
+def shows(date, db, hall=None):
+    """
+    Аргументы: дата, БД, номер зала.
+    Расписание на день (во всех залах, если зал не указан), возвращает список
+    кортежей (номер сеанса, зал, начало, продолжительность, фильм) по залам и времени.
+    """
+    sql = "SELECT show, hall, start, duration, film \
+           FROM {0}Shows \
+           WHERE date=?1 AND (?2 IS NULL OR hall=?2) \
+           ORDER BY hall, start"
+    records = []
+    for schema in partitions(date, date, db):
+        cursor = db.cursor()
+        cursor.execute(sql.format(schema), (str(date), hall))
+        records.extend(cursor.fetchall())
+    return records
+
+def get_show(show, db):
+    """
+    Аргументы: номер сеанса, БД.
+    Возвращает кортеж (номер сеанса, дата, зал, начало, продолжительность, фильм)
+    или None, если сеанса нет.
     """
     cursor = db.cursor()
-    # проверяем наличие записей на указанную дату
-    sql = "SELECT RecNo \
-           FROM Seats \
-           WHERE RecDate={0}".format(date)
-    cursor.execute(sql)
-    day_flag = False
-    for record in cursor:
-        day_flag = True
-    if day_flag:
-        # если записи присутствуют - выходим
-        return 
-    # если записи отсутствуют - добавляем их
-    # генерируем перечень номеров мест
-    hall = []
-    for k in range(1,11):
-        for i in range(1,11):
-            seatno = k * 100 + i
-            hall.append(seatno)
-    # создаем записи для каждого места на указанную дату
-    for seat in hall:
-        sql = "INSERT INTO Seats(SeatCode, \
-                                 Session10, \
-                                 Session12, \
-                                 Session14, \
-                                 Session16, \
-                                 RecDate)  \
-               VALUES ({0}, 0, 0, 0, 0, {1})".format(seat, date)
-        cursor.execute(sql)
-        db.commit()
-        sql = "INSERT INTO Sales(RecDate, \
-                                 SeatCode, \
-                                 Session10, \
-                                 Session12, \
-                                 Session14, \
-                                 Session16)  \
-               VALUES ({0}, {1}, 0, 0, 0, 0)".format(date, seat)
-        cursor.execute(sql)
-        db.commit()
-        
-               
+    cursor.execute("SELECT show, date, hall, start, duration, film FROM Shows WHERE show=?",
+                   (show,))
+    return cursor.fetchone()
+
+def sellable_shows(now, db, hall=None):
+    """
+    Аргументы: текущие дата и время (datetime.datetime), БД, номер зала.
+    Сеансы текущего дня, на которые еще идет продажа, по индексу (дата, конец продажи).
+    Возвращает список кортежей как shows().
+    """
+    cursor = db.cursor()
+    sql = "SELECT show, hall, start, duration, film \
+           FROM Shows \
+           WHERE date=?1 AND sale_until>?2 AND (?3 IS NULL OR hall=?3) \
+           ORDER BY start, hall"
+    cursor.execute(sql, (str(now.date()), now.strftime("%H:%M"), hall))
+    return cursor.fetchall()
+
+def is_sellable(show, now, db):
+    """
+    Аргументы: номер сеанса, текущие дата и время, БД.
+    Проверка, открыта ли еще продажа и возврат билетов на сеанс.
+    """
+    cursor = db.cursor()
+    sql = "SELECT date>?1 OR (date=?1 AND sale_until>?2) FROM Shows WHERE show=?3"
+    cursor.execute(sql, (str(now.date()), now.strftime("%H:%M"), show))
+    record = cursor.fetchone()
+    return bool(record and record[0])
+
+class OccupancyCache:
+    """
+    Кэш занятости залов в памяти с записью продаж и возвратов сразу в БД.
+    Занятость сеанса хранится битовой маской, один бит на место зала сеанса.
+    Хранится не более capacity сеансов, давно не использованные вытесняются.
+    Если базу изменило другое подключение (PRAGMA data_version), кэш сбрасывается.
+    """
+    def __init__(self, db, capacity=16, layout=None):
+        self.db = db
+        self.capacity = capacity
+        self.maps = collections.OrderedDict()
+        # схемы залов по номеру зала, layout задает схему зала 1
+        self.layouts = {} if layout is None else {1: layout}
+        self.halls = {}
+        self.dataVersion = self.getDataVersion()
+
+    def getDataVersion(self):
+        """
+        Возвращает счетчик изменений базы другими подключениями.
+        """
+        cursor = self.db.cursor()
+        cursor.execute("PRAGMA data_version")
+        return cursor.fetchone()[0]
+
+    def layout(self, show):
+        """
+        Аргументы: номер сеанса.
+        Возвращает схему зала, в котором идет сеанс.
+        """
+        hall = self.halls.get(show)
+        if hall is None:
+            record = get_show(show, self.db)
+            hall = record[2] if record is not None else 1
+            self.halls[show] = hall
+        if hall not in self.layouts:
+            self.layouts[hall] = get_hall(self.db, hall)
+        return self.layouts[hall]
+
+    def bits(self, show):
+        """
+        Аргументы: номер сеанса.
+        Возвращает битовую маску проданных мест сеанса, при промахе
+        загружает ее из БД одним запросом. Места, которых нет в текущей
+        схеме зала (схему сменили после продажи), в маску не попадают.
+        """
+        version = self.getDataVersion()
+        if version != self.dataVersion:
+            self.maps.clear()
+            self.dataVersion = version
+        mask = self.maps.get(show)
+        if mask is None:
+            mask = 0
+            index = self.layout(show).index
+            for seat in occupancy(show, self.db):
+                if seat in index:   # места, которых нет в текущей схеме зала, пропускаем
+                    mask |= 1 << index[seat]
+            self.maps[show] = mask
+            if len(self.maps) > self.capacity:
+                self.maps.popitem(last=False)
+        else:
+            self.maps.move_to_end(show)
+        return mask
+
+    def occupancy(self, show):
+        """
+        Аргументы: номер сеанса.
+        Карта занятости зала на сеанс, возвращает множество номеров проданных мест.
+        """
+        mask = self.bits(show)
+        seats = self.layout(show).seats
+        return {seats[i] for i in range(len(seats)) if mask >> i & 1}
+
+    def isVacancy(self, seatNo, show):
+        """
+        Аргументы: номер места, номер сеанса.
+        Проверка занятости места, если место продано - возвращает True, свободно - False.
+        Место не из текущей схемы зала проверяется запросом к БД.
+        """
+        i = self.layout(show).index.get(seatNo)
+        if i is None:
+            return isVacancy(seatNo, show, self.db)
+        return bool(self.bits(show) >> i & 1)
+
+    def update(self, seatNo, show, sold):
+        """
+        Аргументы: номер места, номер сеанса, флаг продажи.
+        Меняет бит места в маске сеанса, если сеанс есть в кэше.
+        """
+        i = self.layout(show).index.get(seatNo)
+        if show in self.maps and i is not None:
+            bit = 1 << i
+            if sold:
+                self.maps[show] |= bit
+            else:
+                self.maps[show] &= ~bit
+
+    def sell_seat(self, seatNo, show, price, operator=None):
+        """
+        Аргументы: номер места, номер сеанса, цена билета, оператор.
+        Продажа места через БД с обновлением кэша. Возвращает результат sell_seat.
+        """
+        result = sell_seat(seatNo, show, price, self.db, operator)
+        if result:
+            self.update(seatNo, show, True)
+        else:
+            # место продано или забронировано другим оператором - перечитываем сеанс из БД
+            self.maps.pop(show, None)
+        return result
+
+    def return_seat(self, seatNo, show):
+        """
+        Аргументы: номер места, номер сеанса.
+        Возврат места через БД с обновлением кэша. Возвращает результат return_seat.
+        """
+        result = return_seat(seatNo, show, self.db)
+        self.update(seatNo, show, False)
+        return result
+
+    def sell_seats(self, seats, show, price, operator=None):
+        """
+        Аргументы: номера мест, номер сеанса, цена билета, оператор.
+        Групповая продажа через БД с обновлением кэша. Возвращает результат sell_seats.
+        """
+        seats = list(seats)
+        result = sell_seats(seats, show, price, self.db, operator)
+        if result:
+            for seatNo in seats:
+                self.update(seatNo, show, True)
+        else:
+            # часть мест продана кем-то другим - перечитываем сеанс из БД
+            self.maps.pop(show, None)
+        return result
+
+    def return_seats(self, seats, show):
+        """
+        Аргументы: номера мест, номер сеанса.
+        Групповой возврат через БД с обновлением кэша. Возвращает результат return_seats.
+        """
+        seats = list(seats)
+        result = return_seats(seats, show, self.db)
+        if result:
+            for seatNo in seats:
+                self.update(seatNo, show, False)
+        else:
+            self.maps.pop(show, None)
+        return result
+
+class WriteBehind:
+    """
+    Режим отложенной записи продаж. Продажа и возврат проверяются по занятости
+    в памяти, дописываются в журнал и сразу подтверждаются, а фоновый поток
+    переносит накопленные операции в БД одной транзакцией каждые interval
+    секунд или каждые batch операций. При запуске операции журнала, не
+    попавшие в базу (сбой приложения), переносятся в нее заново.
+    Журнал сбрасывается в ОС на каждой операции, но без fsync - при отключении
+    питания теряются операции за последний interval. Предполагается, что
+    продажи на эти сеансы идут только через этот объект; операции, которые
+    база все же отвергла (например, бронь другой кассы), попадают в rejected.
+    """
+    def __init__(self, filename, journal=None, interval=0.05, batch=500, profile="terminal"):
+        self.filename = filename
+        self.journalName = journal if journal is not None else filename + ".journal"
+        self.interval = interval
+        self.batch = batch
+        self.db = connect_DB(filename, profile)
+        self.sold = {}          # номер сеанса: множество проданных мест
+        self.pending = []       # операции, еще не перенесенные в базу
+        self.rejected = []      # операции, отвергнутые базой при переносе
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)   # есть работа для потока переноса
+        self.done = threading.Condition(self.lock)    # пачка перенесена в базу
+        self.urgent = self.stopping = False
+        self.seq = self.flushed = self.replay()
+        self.journal = open(self.journalName, "ab", buffering=0)
+        self.thread = threading.Thread(target=self.flushLoop, args=(profile,), daemon=True)
+        self.thread.start()
+
+    def replay(self):
+        """
+        Переносит в базу операции журнала после последней перенесенной
+        и очищает журнал. Возвращает номер последней операции.
+        """
+        cursor = self.db.cursor()
+        cursor.execute("SELECT seq FROM JournalState WHERE journal=?",
+                       (os.path.basename(self.journalName),))
+        record = cursor.fetchone()
+        seq = record[0] if record is not None else 0
+        ops = []
+        if os.path.exists(self.journalName):
+            with open(self.journalName, encoding="utf8") as fh:
+                for line in fh:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:  # недописанная при сбое строка
+                        break
+                    if op["seq"] > seq:
+                        ops.append(op)
+        if ops:
+            self.apply(ops, self.db)
+            seq = ops[-1]["seq"]
+        open(self.journalName, "wb").close()
+        return seq
+
+    def apply(self, ops, db):
+        """
+        Аргументы: список операций журнала, БД.
+        Переносит операции в базу одной транзакцией, каждая операция в своей
+        точке сохранения. Вместе с ними запоминается номер последней операции.
+        Возвращает список отвергнутых базой операций.
+        """
+        rejected = []
+        with transaction(db) as cursor:
+            for op in ops:
+                cursor.execute("SAVEPOINT op")
+                try:
+                    if op["op"] == "sell":
+                        _sell_seats(op["seats"], op["show"], op["price"], op["operator"],
+                                    cursor, op["at"], op["time"])
+                    else:
+                        _return_seats(op["seats"], op["show"], cursor)
+                except sqlite3.IntegrityError:
+                    cursor.execute("ROLLBACK TO op")
+                    rejected.append(op)
+                cursor.execute("RELEASE op")
+            cursor.execute("INSERT OR REPLACE INTO JournalState(journal, seq) VALUES (?, ?)",
+                           (os.path.basename(self.journalName), ops[-1]["seq"]))
+        self.rejected.extend(rejected)
+        return rejected
+
+    def flushLoop(self, profile):
+        """
+        Фоновый поток переноса операций в базу через собственное подключение.
+        """
+        db = connect_DB(self.filename, profile)
+        while True:
+            with self.ready:
+                self.ready.wait_for(lambda: len(self.pending) >= self.batch or
+                                            self.urgent or self.stopping, self.interval)
+                ops, self.pending = self.pending, []
+                stopping, self.urgent = self.stopping, False
+            if ops:
+                rejected = self.apply(ops, db)
+                with self.lock:
+                    # занятость сеансов с отвергнутыми операциями перечитываем из базы
+                    for show in {op["show"] for op in rejected}:
+                        if not any(op["show"] == show for op in self.pending):
+                            self.sold.pop(show, None)
+                    # все принятые операции в базе - журнал больше не нужен
+                    if not self.pending:
+                        self.journal.truncate(0)
+                    self.flushed = ops[-1]["seq"]
+                    self.done.notify_all()
+            if stopping:
+                break
+        db.close()
+
+    def occupancy(self, show):
+        """
+        Аргументы: номер сеанса.
+        Возвращает множество проданных мест сеанса с учетом еще не записанных продаж.
+        """
+        with self.lock:
+            return set(self._sold(show))
+
+    def isVacancy(self, seatNo, show):
+        """
+        Аргументы: номер места, номер сеанса.
+        Проверка занятости места, если место продано - возвращает True, свободно - False
+        """
+        with self.lock:
+            return seatNo in self._sold(show)
+
+    def _sold(self, show):
+        sold = self.sold.get(show)
+        if sold is None:
+            sold = self.sold[show] = occupancy(show, self.db)
+        return sold
+
+    def _append(self, op):
+        """
+        Дописывает операцию в журнал и в очередь переноса, вызывается под блокировкой.
+        """
+        self.seq += 1
+        op["seq"] = self.seq
+        self.journal.write(json.dumps(op).encode("utf8") + b"\n")
+        self.pending.append(op)
+        if len(self.pending) >= self.batch:
+            self.ready.notify()
+
+    def sell_seats(self, seats, show, price, operator=None):
+        """
+        Аргументы: номера мест, номер сеанса, цена билета, оператор.
+        Продажа всех мест или ни одного, возвращает True при успешной продаже.
+        """
+        seats = list(seats)
+        with self.lock:
+            index = show_layout(show, self.db).index
+            if not all(seatNo in index for seatNo in seats):
+                return False
+            sold = self._sold(show)
+            if not sold.isdisjoint(seats) or len(set(seats)) != len(seats):
+                return False
+            sold.update(seats)
+            self._append({"op": "sell", "show": show, "seats": seats, "price": price,
+                          "operator": operator, "at": str(datetime.datetime.now()),
+                          "time": time.time()})
+        return True
+
+    def return_seats(self, seats, show):
+        """
+        Аргументы: номера мест, номер сеанса.
+        Возврат всех мест или ни одного, возвращает True при успешном возврате.
+        """
+        seats = list(seats)
+        with self.lock:
+            sold = self._sold(show)
+            if not sold.issuperset(seats) or len(set(seats)) != len(seats):
+                return False
+            sold.difference_update(seats)
+            self._append({"op": "return", "show": show, "seats": seats})
+        return True
+
+    def sell_seat(self, seatNo, show, price, operator=None):
+        return self.sell_seats([seatNo], show, price, operator)
+
+    def return_seat(self, seatNo, show):
+        return self.return_seats([seatNo], show)
+
+    def flush(self):
+        """
+        Немедленно переносит накопленные операции в базу и ждет окончания переноса.
+        """
+        with self.ready:
+            seq = self.seq
+            self.urgent = True
+            self.ready.notify()
+            self.done.wait_for(lambda: self.flushed >= seq)
+
+    def close(self):
+        """
+        Переносит оставшиеся операции в базу, останавливает поток и закрывает журнал.
+        """
+        with self.ready:
+            self.stopping = True
+            self.ready.notify()
+        self.thread.join()
+        self.journal.close()
+        self.db.close()
+
+def seat_popularity(start, finish, db, hall=1, begin=None):
+    """
+    Аргументы: первый день, последний день, БД, номер зала, начало сеанса ЧЧ:ММ
+    (None - все сеансы).
+    Частота продаж мест зала за период одним агрегирующим запросом (в каждой
+    части истории). Возвращает пару (словарь место: кол-во продаж, кол-во сеансов).
+    """
+    counts = collections.Counter()
+    shows = 0
+    args = (hall, str(start), str(finish), begin)
+    for schema in partitions(start, finish, db):
+        cursor = db.cursor()
+        cursor.execute("SELECT t.seat, COUNT(*) \
+                        FROM {0}Tickets t JOIN {0}Shows sh ON sh.show=t.show \
+                        WHERE sh.hall=?1 AND sh.date BETWEEN ?2 AND ?3 \
+                        AND (?4 IS NULL OR sh.start=?4) \
+                        GROUP BY t.seat".format(schema), args)
+        counts.update(dict(cursor.fetchall()))
+        cursor.execute("SELECT COUNT(*) FROM {0}Shows \
+                        WHERE hall=?1 AND date BETWEEN ?2 AND ?3 \
+                        AND (?4 IS NULL OR start=?4)".format(schema), args)
+        shows += cursor.fetchone()[0]
+    return counts, shows
+
+class PopularityCache:
+    """
+    Кэш частоты продаж мест по ключу (период, зал, начало сеанса).
+    Продажи и возвраты этого подключения вносятся в подходящие записи кэша
+    через update, без повторного запроса. Если базу изменило другое подключение,
+    сбрасываются только записи, период которых не закончился - прошлые дни
+    уже не меняются.
+    """
+    def __init__(self, db, capacity=8):
+        self.db = db
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()
+        self.dataVersion = self.getDataVersion()
+
+    def getDataVersion(self):
+        cursor = self.db.cursor()
+        cursor.execute("PRAGMA data_version")
+        return cursor.fetchone()[0]
+
+    def get(self, start, finish, hall=1, begin=None):
+        """
+        Аргументы: первый день, последний день, номер зала, начало сеанса.
+        Возвращает результат seat_popularity из кэша или из БД.
+        """
+        version = self.getDataVersion()
+        if version != self.dataVersion:
+            today = str(datetime.date.today())
+            for key in [key for key in self.entries if key[1] >= today]:
+                del self.entries[key]
+            self.dataVersion = version
+        key = (str(start), str(finish), hall, begin)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = seat_popularity(start, finish, self.db, hall, begin)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+        return entry
+
+    def update(self, seats, show, delta):
+        """
+        Аргументы: номера мест, номер сеанса, +1 - продажа, -1 - возврат.
+        Вносит продажу или возврат в записи кэша, которые покрывают сеанс.
+        """
+        record = get_show(show, self.db)
+        if record is None:
+            return
+        show, date, hall, begin = record[:4]
+        for (first, last, entryHall, entryBegin), (counts, shows) in self.entries.items():
+            if first <= date <= last and entryHall == hall and entryBegin in (None, begin):
+                for seatNo in seats:
+                    counts[seatNo] += delta
+
+def _capacity(halls, db, layouts=None):
+    """
+    Аргументы: номера залов сеансов, БД, словарь уже загруженных схем залов.
+    Возвращает общее кол-во мест на всех сеансах.
+    """
+    layouts = {} if layouts is None else layouts
+    total = 0
+    for hall in halls:
+        if hall not in layouts:
+            layouts[hall] = get_hall(db, hall)
+        total += len(layouts[hall])
+    return total
+
+def capacity(date, db):
+    """
+    Аргументы: дата, БД.
+    Возвращает кол-во мест на всех сеансах дня во всех залах.
+    """
+    return _capacity([show[1] for show in shows(date, db)], db)
+
+def _report_range(sql, start, finish, db):
+    """
+    Аргументы: запрос, первый день, последний день, БД.
+    Выполняет запрос отчета за диапазон дат по дням и сеансам, запрос
+    возвращает строки (дата, зал, значение) в порядке дат, залов и начала сеансов.
+    Возвращает список троек (дата, кортеж значений по сеансам дня, кортеж залов
+    сеансов), упорядоченный по дате. Незарегистрированные дни в список не попадают.
+    Запрос выполняется по очереди в рабочей базе и в архивах месяцев диапазона,
+    {0} в тексте запроса заменяется на имя схемы.
+    """
+    days = collections.OrderedDict()
+    for schema in partitions(start, finish, db):
+        cursor = db.cursor()
+        cursor.execute(sql.format(schema), (str(start), str(finish)))
+        for date, hall, value in cursor:
+            values, halls = days.setdefault(date, ([], []))
+            if hall is not None:
+                values.append(value or 0)
+                halls.append(hall)
+    return [(date, tuple(values), tuple(halls)) for date, (values, halls) in sorted(days.items())]
+
+# сеансы дня с данными сводки, день без сеансов дает одну строку с NULL
+PLACES_SQL = "SELECT d.date, sh.hall, s.seats_sold \
+              FROM {0}Days d LEFT JOIN {0}Shows sh ON sh.date=d.date \
+                             LEFT JOIN {0}DailySummary s ON s.show=sh.show \
+              WHERE d.date BETWEEN ? AND ? \
+              ORDER BY d.date, sh.hall, sh.start"
+SALES_SQL = PLACES_SQL.replace("s.seats_sold", "s.revenue")
+
 def report_by_places(date, db):
     """
     Аргументы: дата, БД.
     Отчет по проданым местам, возвращает кортеж с кол-вом проданых билетов на
-    каждый отдельный сеанс, кол-во проданных за день, процент проданых за день.
+    каждый сеанс дня в порядке shows(), кол-во проданных за день,
+    процент проданых за день. Если день не зарегистрирован - None.
     """
-    cursor = db.cursor()
-    # считаем для каждого сеанса кол-во проданных билетов (флаг сеанса > 0),
-    # кол-во проданных за день, процент проданых за день
-##    sql = "SELECT DISTINCT \
-##           (SELECT COUNT(Session10) FROM Seats WHERE (Session10>0) AND RecDate={0}) AS s10, \
-##           (SELECT COUNT(Session12) FROM Seats WHERE (Session12>0) AND RecDate={0}) AS s12, \
-##           (SELECT COUNT(Session14) FROM Seats WHERE (Session14>0) AND RecDate={0}) AS s14, \
-##           (SELECT COUNT(Session16) FROM Seats WHERE (Session16>0) AND RecDate={0}) AS s16, \
-##           (s10+s12+s14+s16) AS DailyTotal, \
-##           (DailyTotal/400) AS DailyPercent   \
-##           FROM Seats \
-##           WHERE RecDate={0}".format(date)
-    sql = "SELECT DISTINCT \
-           (SELECT COUNT(Session10) FROM Seats WHERE (Session10>0) AND RecDate={0}) AS s10, \
-           (SELECT COUNT(Session12) FROM Seats WHERE (Session12>0) AND RecDate={0}) AS s12, \
-           (SELECT COUNT(Session14) FROM Seats WHERE (Session14>0) AND RecDate={0}) AS s14, \
-           (SELECT COUNT(Session16) FROM Seats WHERE (Session16>0) AND RecDate={0}) AS s16  \
-           FROM Seats \
-           WHERE RecDate={0}".format(date)
-    cursor.execute(sql)
-    report = cursor.fetchall()
-    if report:
-        s10, s12, s14, s16 = report[0][0], report[0][1], report[0][2], report[0][3]
-        dailytotal = s10 + s12 + s14 + s16
-        dailypercent = dailytotal/400
-        return s10, s12, s14, s16, dailytotal, dailypercent
-    else:
-        return None
+    report = report_by_places_range(date, date, db)
+    return report[0][1:] if report else None
 
 def report_by_sales(date, db):
     """
     Аргументы: дата, БД.
     Отчет по выручке, возвращает кортеж с суммой проданых билетов на
-    каждый отдельный сеанс, сумму за день.
+    каждый сеанс дня в порядке shows(), сумму за день.
+    Если день не зарегистрирован - None.
     """
-    cursor = db.cursor()
-    # считаем для каждого сеанса сумму проданых билетов и сумму за весь день
-    sql = "SELECT SUM(Session10) AS s10, \
-                  SUM(Session12) AS s12, \
-                  SUM(Session14) AS s14, \
-                  SUM(Session16) AS s16  \
-                  FROM Sales \
-                  WHERE RecDate={0}".format(date)
-    cursor.execute(sql)
-    report = cursor.fetchall()
-    if report:
-        s10, s12, s14, s16 = report[0][0], report[0][1], report[0][2], report[0][3]
-        dailytotal = s10 + s12 + s14 + s16
-        return s10, s12, s14, s16, dailytotal
-    else:
-        return None
+    report = report_by_sales_range(date, date, db)
+    return report[0][1:] if report else None
 
-### test ###
+def report_by_places_range(start, finish, db, with_capacity=False):
+    """
+    Аргументы: первый день, последний день, БД, добавлять ли вместимость дня.
+    Отчет по проданым местам за диапазон дат включительно одним запросом.
+    Возвращает список кортежей: дата, кол-во проданых билетов на каждый сеанс
+    дня, кол-во проданных за день, процент проданых за день. Кол-во сеансов
+    в разные дни может отличаться, итоги всегда два последних элемента.
+    Если with_capacity - после итогов добавляется кол-во мест на всех сеансах дня.
+    """
+    layouts = {}
+    report = []
+    for date, values, halls in _report_range(PLACES_SQL, start, finish, db):
+        dailytotal = sum(values)
+        capacity = _capacity(halls, db, layouts)
+        row = (date,) + values + (dailytotal, dailytotal / capacity if capacity else 0)
+        report.append(row + (capacity,) if with_capacity else row)
+    return report
 
-def show_all_sales(db):
+def report_by_sales_range(start, finish, db):
+    """
+    Аргументы: первый день, последний день, БД.
+    Отчет по выручке за диапазон дат включительно одним запросом.
+    Возвращает список кортежей: дата, сумма проданых билетов на каждый сеанс
+    дня, сумма за день.
+    """
+    return [(date,) + values + (sum(values),)
+            for date, values, halls in _report_range(SALES_SQL, start, finish, db)]
+
+def check_summary(db):
     """
     Аргументы: БД.
-    Выводит в консоль содержимое всей таблицы с продажами.
-    Осторожно, данных может быть оч много.
+    Сверка сводки по сеансам DailySummary с таблицей билетов. Возвращает список
+    расхождений (дата, номер сеанса), пустой список - сводка согласована.
     """
     cursor = db.cursor()
-    sql = "SELECT * FROM Sales"
+    sql = "SELECT date, show, SUM(sold), SUM(revenue) FROM ( \
+               SELECT date, show, COUNT(*) AS sold, COALESCE(SUM(price), 0) AS revenue \
+               FROM Tickets GROUP BY show \
+               UNION ALL \
+               SELECT date, show, -seats_sold, -revenue FROM DailySummary) \
+           GROUP BY show \
+           HAVING SUM(sold) != 0 OR SUM(revenue) != 0"
     cursor.execute(sql)
-    print("Sales :")
-    print("{0:5}|{1:^15}|{2:^5}|{3:^7}|{4:^7}|{5:^7}|{6:^7}".format("RecNo",
-                                                              "RDate",
-                                                              "SCode",
-                                                              "S10",
-                                                              "S12",
-                                                              "S14",
-                                                              "S16"))
-    for record in cursor:
-        print("{0:5}|{1:^15}|{2:^5}|{3:^7}|{4:^7}|{5:^7}|{6:^7}".format(*record))
-    
-def show_all_seats(db):
+    return [(record[0], record[1]) for record in cursor]
+
+def rebuild_summary(db):
     """
     Аргументы: БД.
-    Выводит в консоль содержимое всей таблицы с местами.
-    Осторожно, данных может быть оч много.
+    Пересчет сводки по сеансам DailySummary заново по таблице билетов.
+    """
+    with transaction(db) as cursor:
+        cursor.execute("DELETE FROM DailySummary")
+        cursor.execute("INSERT INTO DailySummary(show, date, seats_sold, revenue) \
+                        SELECT show, date, COUNT(*), COALESCE(SUM(price), 0) \
+                        FROM Tickets GROUP BY show")
+
+# таблицы архива месяца, сводка переносится готовой, триггеры не нужны
+ARCHIVE_TABLES = (
+    "CREATE TABLE IF NOT EXISTS archive.Days ( \
+         date TEXT PRIMARY KEY NOT NULL, \
+         price INTEGER)",
+    "CREATE TABLE IF NOT EXISTS archive.Shows ( \
+         show INTEGER PRIMARY KEY NOT NULL, \
+         date TEXT NOT NULL, \
+         hall INTEGER NOT NULL, \
+         start TEXT NOT NULL, \
+         duration INTEGER NOT NULL, \
+         film TEXT, \
+         sale_until TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS archive.ShowsDate ON Shows(date)",
+    "CREATE TABLE IF NOT EXISTS archive.Tickets ( \
+         RecNo INTEGER PRIMARY KEY NOT NULL, \
+         show INTEGER NOT NULL, \
+         date TEXT NOT NULL, \
+         seat INTEGER NOT NULL, \
+         price INTEGER, \
+         sold_at TEXT, \
+         operator TEXT)",
+    "CREATE TABLE IF NOT EXISTS archive.DailySummary ( \
+         show INTEGER PRIMARY KEY NOT NULL, \
+         date TEXT NOT NULL, \
+         seats_sold INTEGER NOT NULL, \
+         revenue INTEGER NOT NULL)",
+)
+
+def parse_month(month):
+    """
+    Аргументы: месяц строкой ГГГГ-ММ.
+    Проверка месяца, возвращает его в виде ГГГГ-ММ, иначе ValueError.
+    """
+    if not re.fullmatch(r"\d{4}-\d{2}", str(month)) or not 1 <= int(month[5:7]) <= 12:
+        raise ValueError("month {0!r} is not YYYY-MM".format(month))
+    first = datetime.date(int(month[:4]), int(month[5:7]), 1)
+    return "{0:04d}-{1:02d}".format(first.year, first.month)
+
+def _month_range(month):
+    """
+    Аргументы: месяц ГГГГ-ММ.
+    Возвращает первый день месяца и первый день следующего месяца строками.
+    """
+    month = parse_month(month)
+    year, number = int(month[:4]), int(month[5:7])
+    following = (year + 1, 1) if number == 12 else (year, number + 1)
+    return "{0:04d}-{1:02d}-01".format(year, number), "{0:04d}-{1:02d}-01".format(*following)
+
+def archive_path(month, db):
+    """
+    Аргументы: месяц ГГГГ-ММ, БД.
+    Имя файла архива месяца рядом с файлом рабочей базы: база-ГГГГ-ММ.расширение.
     """
     cursor = db.cursor()
-    sql = "SELECT * FROM Seats"
-    cursor.execute(sql)
-    print("Seats :")
-    print("{0:5}|{1:^5}|{2:^7}|{3:^7}|{4:^7}|{5:^7}|{6:^15}".format("RecNo",
-                                                                    "SCode",
-                                                                    "S10",
-                                                                    "S12",
-                                                                    "S14",
-                                                                    "S16",
-                                                                    "RDate"))
-    for record in cursor:
-        print("{0:5}|{1:^5}|{2:^7}|{3:^7}|{4:^7}|{5:^7}|{6:^15}".format(*record))
-
-def randomize_base(date, price, db):
+    cursor.execute("PRAGMA database_list")
+    filename = [record[2] for record in cursor if record[1] == "main"][0]
+    stem, ext = os.path.splitext(filename)
+    return "{0}-{1}{2}".format(stem, month, ext or ".db")
+
+@contextlib.contextmanager
+def attach_archive(filename, db):
     """
-    Аргументы: дата, цена билета, БД.
-    Вводит в базу данных случайные значения проданых мест.
-    Осторожно, данных может быть оч много.
-    """
-    new_day(date, price, db)
-    # генерируем перечень номеров мест
-    hall = []
-    for k in range(1,11):
-        for i in range(1,11):
-            seatno = k * 100 + i
-            hall.append(seatno)
-    # для каждого места кидаем монетку 1/0, если 1 - продаем место
-    for seat in hall:
-        for session in SESSIONS:
-            foo = random.randint(0,1)
-            if foo:
-                sell_seat(seat, session, date, price, db)
-        
+    Аргументы: файл архива, БД.
+    Контекст подключения архива к БД под именем схемы archive.
+    """
+    db.execute("ATTACH DATABASE ? AS archive", (filename,))
+    try:
+        yield "archive."
+    finally:
+        db.execute("DETACH DATABASE archive")
+
+def partitions(start, finish, db):
+    """
+    Аргументы: первый день, последний день, БД.
+    Генератор префиксов схем для запроса к диапазону дат: сначала архивы
+    месяцев диапазона по одному (архив подключен, пока не запрошен следующий),
+    затем рабочая база. Так запрос за любое число месяцев не упирается в
+    ограничение SQLite на кол-во подключенных баз.
+    """
+    cursor = db.cursor()
+    cursor.execute("SELECT month, filename FROM Archives WHERE month BETWEEN ? AND ? ORDER BY month",
+                   (str(start)[:7], str(finish)[:7]))
+    folder = os.path.dirname(archive_path("", db))
+    for month, filename in cursor.fetchall():
+        with attach_archive(os.path.join(folder, filename), db) as schema:
+            yield schema
+    yield "main."
+
+def archive_month(month, db):
+    """
+    Аргументы: месяц ГГГГ-ММ, БД.
+    Переносит дни, сеансы, билеты и сводку закрытого месяца из рабочей базы
+    в архивную базу месяца. Текущий и будущие месяцы не архивируются.
+    Возвращает кол-во перенесенных дней.
+    """
+    month = parse_month(month)
+    first, following = _month_range(month)
+    if following > str(datetime.date.today()):
+        raise ValueError("month {0} is not closed yet".format(month))
+    filename = archive_path(month, db)
+    with attach_archive(filename, db):
+        # в режиме WAL фиксация в двух файлах не атомарна: при сбое строки могут
+        # остаться и в архиве, и в рабочей базе, но не потеряются
+        with transaction(db) as cursor:
+            for sql in ARCHIVE_TABLES:
+                cursor.execute(sql)
+            where = " WHERE date>=? AND date<?"
+            for table in ("Days", "Shows", "Tickets", "DailySummary"):
+                cursor.execute("INSERT OR REPLACE INTO archive.{0} SELECT * FROM main.{0}".format(table)
+                               + where, (first, following))
+            cursor.execute("SELECT COUNT(*) FROM main.Days" + where, (first, following))
+            days = cursor.fetchone()[0]
+            cursor.execute("DELETE FROM main.Holds WHERE show IN \
+                            (SELECT show FROM main.Shows" + where + ")", (first, following))
+            # сводку удаляем раньше билетов, чтобы триггер возврата ее не менял
+            for table in ("DailySummary", "Tickets", "Shows", "Days"):
+                cursor.execute("DELETE FROM main.{0}".format(table) + where, (first, following))
+            cursor.execute("INSERT OR REPLACE INTO Archives(month, filename) VALUES (?, ?)",
+                           (month, os.path.basename(filename)))
+    return days
+
+def archive_closed(db, keep=1):
+    """
+    Аргументы: БД, кол-во последних закрытых месяцев, остающихся в рабочей базе.
+    Архивирует все закрытые месяцы, кроме keep последних.
+    Возвращает список заархивированных месяцев.
+    """
+    today = datetime.date.today()
+    year, number = today.year, today.month - keep
+    while number < 1:
+        year, number = year - 1, number + 12
+    cursor = db.cursor()
+    cursor.execute("SELECT DISTINCT substr(date, 1, 7) FROM Days WHERE date<? ORDER BY 1",
+                   ("{0:04d}-{1:02d}-01".format(year, number),))
+    months = [record[0] for record in cursor.fetchall()]
+    for month in months:
+        archive_month(month, db)
+    return months
+
+PAGE = 5000  # кол-во строк, выбираемых за один запрос при постраничном чтении
+TICKET_FIELDS = ("RecNo", "date", "hall", "start", "show", "seat", "price", "sold_at", "operator")
+DAY_FIELDS = ("date", "price", "shows", "sold")
+
+def iter_tickets(db, start=None, finish=None, show=None, page=PAGE):
+    """
+    Аргументы: БД, первый день, последний день, номер сеанса, размер страницы.
+    Генератор проданных билетов в порядке RecNo с отбором по датам и сеансу,
+    включая архивы месяцев. Строки читаются страницами по ключу RecNo,
+    в памяти одновременно не больше одной страницы.
+    Возвращает кортежи со значениями полей TICKET_FIELDS.
+    """
+    start = str(start) if start is not None else "0000-00-00"
+    finish = str(finish) if finish is not None else "9999-99-99"
+    sql = "SELECT t.RecNo, t.date, sh.hall, sh.start, t.show, t.seat, t.price, t.sold_at, t.operator \
+           FROM {0}Tickets t JOIN {0}Shows sh ON sh.show=t.show \
+           WHERE t.RecNo>?1 AND t.date BETWEEN ?2 AND ?3 AND (?4 IS NULL OR t.show=?4) \
+           ORDER BY t.RecNo \
+           LIMIT ?5"
+    for schema in partitions(start, finish, db):
+        last = -1
+        while True:
+            cursor = db.cursor()
+            cursor.execute(sql.format(schema), (last, start, finish, show, page))
+            records = cursor.fetchall()
+            yield from records
+            if len(records) < page:
+                break
+            last = records[-1][0]
+
+def iter_days(db, start=None, finish=None, page=PAGE):
+    """
+    Аргументы: БД, первый день, последний день, размер страницы.
+    Генератор зарегистрированных дней по порядку дат, включая архивы месяцев,
+    со страничным чтением по ключу даты.
+    Возвращает кортежи со значениями полей DAY_FIELDS.
+    """
+    start = str(start) if start is not None else "0000-00-00"
+    finish = str(finish) if finish is not None else "9999-99-99"
+    sql = "SELECT d.date, d.price, \
+                  (SELECT COUNT(*) FROM {0}Shows sh WHERE sh.date=d.date), \
+                  (SELECT COALESCE(SUM(s.seats_sold), 0) FROM {0}DailySummary s WHERE s.date=d.date) \
+           FROM {0}Days d \
+           WHERE d.date>?1 AND d.date BETWEEN ?2 AND ?3 \
+           ORDER BY d.date \
+           LIMIT ?4"
+    for schema in partitions(start, finish, db):
+        last = ""
+        while True:
+            cursor = db.cursor()
+            cursor.execute(sql.format(schema), (last, start, finish, page))
+            records = cursor.fetchall()
+            yield from records
+            if len(records) < page:
+                break
+            last = records[-1][0]
+
+def export_rows(rows, fields, filename, fmt=None):
+    """
+    Аргументы: итератор строк, имена полей, файл, формат "csv" или "jsonl"
+    (по умолчанию - по расширению файла).
+    Потоковая запись строк в файл без накопления в памяти.
+    Возвращает кол-во записанных строк.
+    """
+    fmt = fmt or os.path.splitext(filename)[1].lstrip(".").lower()
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError("unknown export format {0!r}".format(fmt))
+    count = 0
+    with open(filename, "w", newline="", encoding="utf8") as fh:
+        if fmt == "csv":
+            writer = csv.writer(fh)
+            writer.writerow(fields)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            # один кодировщик на всю выгрузку: json.dumps с параметрами создает его заново
+            encode = json.JSONEncoder(ensure_ascii=False).encode
+            for row in rows:
+                fh.write(encode(dict(zip(fields, row))))
+                fh.write("\n")
+                count += 1
+    return count
+
+def export_tickets(filename, db, start=None, finish=None, show=None, fmt=None):
+    """
+    Аргументы: файл, БД, первый день, последний день, номер сеанса, формат.
+    Выгрузка проданных билетов в CSV или JSON Lines, возвращает кол-во строк.
+    """
+    return export_rows(iter_tickets(db, start, finish, show), TICKET_FIELDS, filename, fmt)
+
+def export_days(filename, db, start=None, finish=None, fmt=None):
+    """
+    Аргументы: файл, БД, первый день, последний день, формат.
+    Выгрузка зарегистрированных дней в CSV или JSON Lines, возвращает кол-во строк.
+    """
+    return export_rows(iter_days(db, start, finish), DAY_FIELDS, filename, fmt)
+
+# трассировка: включается только по запросу, выключенная ничего не стоит
+TRACER = None       # текущий Tracer, None - трассировка выключена
+SLOWEST = 20        # кол-во самых долгих запросов в отчете
+UNTRACED = ("enable_tracing", "disable_tracing", "timing")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+class Tracer:
+    """
+    Сбор статистики трассировки: по каждому запросу (текст с литералами,
+    замененными на ?) - кол-во выполнений и суммарное время, по каждой
+    публичной функции модуля и отмеченному участку - кол-во вызовов и время
+    с учетом вложенных вызовов, плюс SLOWEST самых долгих запросов с их текстом.
+    Время запроса - от его начала до начала следующего запроса или выхода
+    из внешней функции модуля, поэтому оно включает и разбор результата.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()   # текущий запрос и глубина вызовов потока
+        self.statements = {}             # запрос: [кол-во, время]
+        self.functions = {}              # функция: [кол-во, время]
+        self.slowest = []                # куча (время, текст запроса)
+        self.originals = {}              # имя функции: функция без обертки
+        self.connections = []
+        self.started = time.time()
+
+    def attach(self, db):
+        """
+        Аргументы: БД.
+        Подключает трассировку запросов подключения.
+        """
+        db.set_trace_callback(self.onStatement)
+        self.connections.append(db)
+
+    def detach(self):
+        """
+        Отключает трассировку от всех подключений.
+        """
+        for db in self.connections:
+            try:
+                db.set_trace_callback(None)
+            except sqlite3.ProgrammingError:    # подключение уже закрыто
+                pass
+        self.connections = []
+
+    def record(self, table, key, elapsed):
+        with self.lock:
+            entry = table.get(key)
+            if entry is None:
+                table[key] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def onStatement(self, sql):
+        now = time.perf_counter()
+        self.closeStatement(now)
+        self.local.statement = (sql, now)
+
+    def closeStatement(self, now):
+        """
+        Аргументы: текущее время perf_counter.
+        Завершает замер текущего запроса потока.
+        """
+        current = getattr(self.local, "statement", None)
+        if current is None:
+            return
+        self.local.statement = None
+        sql, start = current
+        elapsed = now - start
+        self.record(self.statements, _SPACES.sub(" ", _LITERALS.sub("?", sql)).strip(), elapsed)
+        with self.lock:
+            if len(self.slowest) < SLOWEST:
+                heapq.heappush(self.slowest, (elapsed, sql))
+            elif elapsed > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (elapsed, sql))
+
+    def wrap(self, name, func):
+        """
+        Аргументы: имя, функция.
+        Возвращает обертку функции с замером времени вызова.
+        """
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            local = self.local
+            depth = getattr(local, "depth", 0)
+            local.depth = depth + 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                now = time.perf_counter()
+                local.depth = depth
+                if not depth:
+                    self.closeStatement(now)
+                self.record(self.functions, name, now - start)
+        return traced
+
+    @contextlib.contextmanager
+    def section(self, name):
+        """
+        Аргументы: имя участка.
+        Контекст замера участка кода вне модуля, например перерисовки окна.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(self.functions, name, time.perf_counter() - start)
+
+    def report(self):
+        """
+        Возвращает статистику словарем: запросы и функции по убыванию
+        суммарного времени, самые долгие запросы, время в мс.
+        """
+        def rows(table):
+            return [{"name": name, "calls": calls, "total_ms": round(total * 1e3, 3),
+                     "avg_us": round(total / calls * 1e6, 1)}
+                    for name, (calls, total) in sorted(table.items(), key=lambda item: -item[1][1])]
+        with self.lock:
+            return {"started": str(datetime.datetime.fromtimestamp(self.started)),
+                    "seconds": round(time.time() - self.started, 3),
+                    "functions": rows(self.functions),
+                    "statements": rows(self.statements),
+                    "slowest": [{"ms": round(elapsed * 1e3, 3), "sql": sql}
+                                for elapsed, sql in sorted(self.slowest, reverse=True)]}
+
+    def dump(self, filename):
+        """
+        Аргументы: файл.
+        Сохраняет статистику в JSON.
+        """
+        with open(filename, "w", encoding="utf8") as file:
+            json.dump(self.report(), file, ensure_ascii=False, indent=2)
+
+def enable_tracing(*connections):
+    """
+    Аргументы: подключения к БД.
+    Включает трассировку: публичные функции модуля заменяются обертками
+    с замером времени, запросы переданных и всех новых подключений
+    connect_DB попадают в статистику. Повторный вызов только добавляет
+    подключения. Возвращает текущий Tracer.
+    """
+    global TRACER
+    if TRACER is None:
+        tracer = Tracer()
+        for name, func in list(globals().items()):
+            if name.startswith("_") or name in UNTRACED or not inspect.isfunction(func) \
+               or func.__module__ != __name__ or inspect.isgeneratorfunction(inspect.unwrap(func)):
+                continue    # генераторы и контексты отработали бы мгновенно, их не меряем
+            tracer.originals[name] = func
+            globals()[name] = tracer.wrap(name, func)
+        TRACER = tracer
+    for db in connections:
+        TRACER.attach(db)
+    return TRACER
+
+def disable_tracing():
+    """
+    Выключает трассировку и возвращает функции модуля без оберток.
+    Возвращает Tracer с собранной статистикой или None, если трассировка
+    не была включена.
+    """
+    global TRACER
+    tracer, TRACER = TRACER, None
+    if tracer is not None:
+        globals().update(tracer.originals)
+        tracer.detach()
+    return tracer
+
+def timing(name):
+    """
+    Аргументы: имя участка.
+    Контекст замера участка кода вызывающего модуля, при выключенной
+    трассировке ничего не делает.
+    """
+    if TRACER is None:
+        return contextlib.nullcontext()
+    return TRACER.section(name)
+
+### test ###
+
+def show_all_sales(db, start=None, finish=None, show=None):
+    """
+    Аргументы: БД, первый день, последний день, номер сеанса.
+    Выводит в консоль проданные билеты, по умолчанию - все.
+    Строки читаются постранично, память не зависит от кол-ва билетов.
+    """
+    print("Tickets :")
+    print("{0:5}|{1:^12}|{2:^5}|{3:^7}|{4:^6}|{5:^5}|{6:^7}|{7:^28}|{8}".format(*TICKET_FIELDS))
+    for record in iter_tickets(db, start, finish, show):
+        print("{0:5}|{1:^12}|{2:^5}|{3:^7}|{4:^6}|{5:^5}|{6!s:^7}|{7!s:^28}|{8!s}".format(*record))
     
-        
+def show_all_seats(db, start=None, finish=None):
+    """
+    Аргументы: БД, первый день, последний день.
+    Выводит в консоль перечень зарегистрированных дней с кол-вом сеансов
+    и проданных мест, по умолчанию - все дни.
+    """
+    print("Days :")
+    print("{0:^12}|{1:^7}|{2:^7}|{3:^7}".format(*DAY_FIELDS))
+    for record in iter_days(db, start, finish):
+        print("{0:^12}|{1!s:^7}|{2:^7}|{3:^7}".format(*record))
+
+WEEKDAY_DEMAND = (0.55, 0.5, 0.55, 0.6, 0.85, 1.0, 0.9)  # спрос по дням недели, пн..вс
+SESSION_DEMAND = ((0, 0.45), (12, 0.6), (15, 0.8), (18, 1.0), (22, 0.75))  # (с часа, спрос)
+SESSION_PRICE = ((0, 0.8), (12, 1.0), (18, 1.2))  # (с часа, множитель цены)
+WEEKEND_PRICE = 1.2     # множитель цены в пятницу..воскресенье
+GENERATE_CHUNK = 366    # кол-во дней в одной транзакции генератора
+
+def _by_hour(curve, start):
+    """
+    Аргументы: кривая ((с часа, значение), ...), начало сеанса ЧЧ:ММ.
+    Значение кривой для часа начала сеанса.
+    """
+    hour = int(start.split(":")[0])
+    return [value for since, value in curve if since <= hour][-1]
+
+def _seat_weights(layout):
+    """
+    Аргументы: схема зала.
+    Спрос на места схемы: середина зала по рядам и центр ряда продаются охотнее.
+    """
+    rows = max(layout.row, default=1)
+    width = max(layout.width - 1, 1)
+    return [(1 - 0.4 * abs(2 * row - rows - 1) / max(rows - 1, 1)) *
+            (1 - 0.5 * abs(2 * column - width) / width)
+            for row, column in zip(layout.row, layout.column)]
+
+def generate_history(start, finish, db, seed=0, price=30, demand=0.9, spread=0.1,
+                     schedule=DEFAULT_SCHEDULE, halls=(1,)):
+    """
+    Аргументы: первый день, последний день (datetime.date), БД, зерно генератора,
+    базовая цена билета, спрос на лучший сеанс лучшего дня (доля мест),
+    разброс цены по дням, расписание ЧЧ:ММ, номера залов.
+    Заполняет БД правдоподобной историей продаж для нагрузочных испытаний.
+    Каждый еще не зарегистрированный день получает расписание schedule во всех
+    залах, цену дня с разбросом и надбавкой на выходные, а каждое место - продажу
+    с вероятностью по кривым спроса WEEKDAY_DEMAND, SESSION_DEMAND и
+    месту в зале. Цена билета зависит от времени сеанса SESSION_PRICE.
+    Уже зарегистрированные дни и дни месяцев, перенесенных в архив, не
+    меняются. Данные вставляются пачками по GENERATE_CHUNK дней в транзакции,
+    время продажи и оператор не заполняются.
+    На время транзакции триггер TicketSold снимается, сводка по сеансам пачки
+    считается одним запросом - так вставка идет вдвое быстрее.
+    При одном зерне и одной БД результат одинаковый, seed=None - случайное зерно.
+    Возвращает пару (кол-во добавленных дней, кол-во проданных билетов).
+    """
+    rnd = random.Random(seed)
+    layouts = {hall: get_hall(db, hall) for hall in halls}
+    weights = {hall: list(zip(layout.seats, _seat_weights(layout)))
+               for hall, layout in layouts.items()}
+    slots = [(start_time, _by_hour(SESSION_DEMAND, start_time), _by_hour(SESSION_PRICE, start_time),
+              _sale_until(start_time, DEFAULT_DURATION)) for start_time in schedule]
+    cursor = db.cursor()
+    cursor.execute("SELECT date FROM Days WHERE date BETWEEN ? AND ?", (str(start), str(finish)))
+    existing = {date for (date,) in cursor.fetchall()}
+    cursor.execute("SELECT month FROM Archives WHERE month BETWEEN ? AND ?",
+                   (str(start)[:7], str(finish)[:7]))
+    archived = {month for (month,) in cursor.fetchall()}
+    days = [start + datetime.timedelta(n) for n in range((finish - start).days + 1)]
+    days = [day for day in days if str(day) not in existing and str(day)[:7] not in archived]
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name='TicketSold'")
+    trigger = cursor.fetchone()[0]
+    sold = 0
+    for first in range(0, len(days), GENERATE_CHUNK):
+        chunk = days[first:first + GENERATE_CHUNK]
+        with transaction(db) as cursor:
+            dayPrices = {}
+            for day in chunk:
+                factor = WEEKEND_PRICE if day.weekday() >= 4 else 1
+                dayPrices[str(day)] = round(price * factor * rnd.uniform(1 - spread, 1 + spread))
+            cursor.executemany("INSERT INTO Days(date, price) VALUES (?, ?)", dayPrices.items())
+            # номера сеансов растут (AUTOINCREMENT): сеансы пачки - все после последнего,
+            # сеансы уже зарегистрированных дней внутри диапазона не затрагиваются
+            cursor.execute("SELECT COALESCE(MAX(show), 0) FROM Shows")
+            lastShow = cursor.fetchone()[0]
+            cursor.executemany("INSERT INTO Shows(date, hall, start, duration, sale_until) \
+                                VALUES (?, ?, ?, ?, ?)",
+                               [(str(day), hall, start_time, DEFAULT_DURATION, saleUntil)
+                                for day in chunk for hall in halls
+                                for start_time, rate, cost, saleUntil in slots])
+            cursor.execute("SELECT show, date, hall, start FROM Shows WHERE show>?", (lastShow,))
+            showIds = {(date, hall, start_time): show
+                       for show, date, hall, start_time in cursor.fetchall()}
+            tickets = []
+            random_ = rnd.random
+            for day in chunk:
+                date = str(day)
+                dayDemand = demand * WEEKDAY_DEMAND[day.weekday()] * rnd.uniform(0.8, 1.2)
+                for hall in halls:
+                    for start_time, rate, cost, saleUntil in slots:
+                        show = showIds[(date, hall, start_time)]
+                        chance = dayDemand * rate
+                        ticketPrice = round(dayPrices[date] * cost)
+                        tickets.extend((show, date, seat, ticketPrice)
+                                       for seat, weight in weights[hall]
+                                       if random_() < chance * weight)
+            cursor.execute("DROP TRIGGER TicketSold")
+            cursor.executemany("INSERT INTO Tickets(show, date, seat, price) \
+                                VALUES (?, ?, ?, ?)", tickets)
+            cursor.execute("INSERT INTO DailySummary(show, date, seats_sold, revenue) \
+                            SELECT show, date, COUNT(*), SUM(price) FROM Tickets \
+                            WHERE show>? GROUP BY show", (lastShow,))
+            cursor.execute(trigger)
+            sold += len(tickets)
+    return len(days), sold
+
 ### test ###
 
 
-if __name__ == "__main__":
+def admin_menu(filename=file):
     """
-    Если модуль запускается не из другого приложения, а как самостоятельная
-    программа - работаем в режиме администрирования через консоль.
+    Аргументы: файл БД.
+    Интерактивное администрирование через консольное меню на текущую дату.
     """
     print("__Administration mode ON__")
     db = None
@@ -311,27 +1923,171 @@ if __name__ == "__main__":
         try:
             r = int(input(MENU))
             if r == 1:
-                db = connect_DB(file)
+                db = connect_DB(filename)
                 print("DB was successefully connected")
             elif r == 2:
                 new_day(todaydate, ticket, db)
-            elif r == 3:
-                report = report_by_places(todaydate, db)
-                print(todaydate, " : ", *report)
-            elif r == 4:
-                report = report_by_sales(todaydate, db)
-                print(todaydate, " : ", *report)
+            elif r in (3, 4):
+                report = (report_by_places if r == 3 else report_by_sales)(todaydate, db)
+                if report is None:
+                    print(todaydate, " : day is not registered (menu item 2)")
+                else:
+                    print(todaydate, " : ", *report)
             elif r == 5:
                 show_all_seats(db)
                 show_all_sales(db)
             elif r == 6:
-                randomize_base(todaydate, ticket, db)
+                today = datetime.date.today()
+                generate_history(today, today, db, seed=None, price=ticket)
                 print("DB was successefully populated")
             elif r == 7:
+                errors = check_summary(db)
+                if errors:
+                    print("Daily summary mismatch:", *errors)
+                    rebuild_summary(db)
+                    print("Daily summary was rebuilt")
+                else:
+                    print("Daily summary is consistent")
+            elif r == 8:
                 break
             else:
-                raise ValueError
+                raise ValueError("no such menu item")
         except ValueError as err:
-            print(err + ", it sould be number from 1 to 3")
+            print("{0}, it should be number from 1 to 8".format(err))
+        except (AttributeError, sqlite3.Error) as err:   # БД не подключена или ошибка БД
+            print("DB error: {0}, connect the DB first (menu item 1)".format(err))
     if db is not None:
-            db.close()
+        db.close()
+
+def _report_days(kind, start, finish, db):
+    """
+    Аргументы: вид отчета places или sales, первый день, последний день, БД.
+    Отчет за диапазон дат списком словарей для вывода в JSON.
+    """
+    if kind == "places":
+        return [{"date": row[0], "values": list(row[1:-2]), "total": row[-2], "percent": row[-1]}
+                for row in report_by_places_range(start, finish, db)]
+    return [{"date": row[0], "values": list(row[1:-1]), "total": row[-1]}
+            for row in report_by_sales_range(start, finish, db)]
+
+def vacuum(db):
+    """
+    Аргументы: БД.
+    Обслуживание базы: перенос журнала WAL в файл БД, сжатие файла,
+    обновление статистики планировщика. Возвращает размер файла до и после, байт.
+    """
+    filename = db.execute("PRAGMA database_list").fetchone()[2]
+    def size():
+        return sum(os.path.getsize(name) for name in (filename, filename + "-wal")
+                   if os.path.exists(name))
+    before = size()
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.execute("VACUUM")
+    db.execute("PRAGMA optimize")
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return before, size()
+
+def run_command(args):
+    """
+    Аргументы: разобранные аргументы командной строки.
+    Выполняет команду пакетного режима, возвращает результат словарем.
+    """
+    db = connect_DB(args.db, args.profile)
+    try:
+        if args.command == "init":
+            return {"db": args.db, "schema_version": schema_version(db)}
+        if args.command == "new-days":
+            return {"added": new_days(args.start, args.finish or args.start, args.price, db)}
+        if args.command == "report":
+            return {"report": args.kind,
+                    "days": _report_days(args.kind, args.start, args.finish or args.start, db)}
+        if args.command == "export":
+            export = export_tickets if args.table == "tickets" else export_days
+            return {"file": args.file,
+                    "rows": export(args.file, db, args.start, args.finish, fmt=args.format)}
+        if args.command == "seed":
+            days, sold = generate_history(args.start, args.finish or args.start, db, seed=args.seed,
+                                          price=args.price, demand=args.demand,
+                                          schedule=tuple(args.schedule), halls=tuple(args.halls))
+            return {"days": days, "tickets": sold}
+        if args.command == "vacuum":
+            before, after = vacuum(db)
+            return {"size_before": before, "size_after": after}
+        if args.command == "archive":
+            if args.month:
+                return {"archived": [{"month": month, "days": archive_month(month, db)}
+                                     for month in args.month]}
+            return {"archived": archive_closed(db, args.keep)}
+        if args.command == "check":
+            errors = check_summary(db)
+            if errors and args.rebuild:
+                rebuild_summary(db)
+            return {"mismatches": [list(error) for error in errors],
+                    "rebuilt": bool(errors and args.rebuild)}
+    finally:
+        db.close()
+
+def main(argv=None):
+    """
+    Аргументы: аргументы командной строки (None - sys.argv).
+    Пакетный режим администрирования: команда из командной строки, результат -
+    JSON в stdout, ошибка - JSON в stderr и код возврата 1. Без команды
+    запускается интерактивное меню. Возвращает код возврата.
+    """
+    date = datetime.date.fromisoformat
+    parser = argparse.ArgumentParser(description="CinemaApp DB administration.")
+    parser.add_argument("--db", default=file, help="DB file (default %(default)s)")
+    parser.add_argument("--profile", default="terminal", choices=sorted(PROFILES))
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.add_parser("menu", help="interactive menu (default)")
+    commands.add_parser("init", help="create the DB or migrate its schema")
+    command = commands.add_parser("new-days", help="register days with the default schedule")
+    command.add_argument("start", type=date)
+    command.add_argument("finish", type=date, nargs="?", help="last day (default start)")
+    command.add_argument("--price", type=int, default=30)
+    command = commands.add_parser("report", help="places or sales report over a range of days")
+    command.add_argument("start", type=date)
+    command.add_argument("finish", type=date, nargs="?", help="last day (default start)")
+    command.add_argument("--kind", choices=("places", "sales"), default="places")
+    command = commands.add_parser("export", help="stream tickets or days to CSV / JSON Lines")
+    command.add_argument("table", choices=("tickets", "days"))
+    command.add_argument("file")
+    command.add_argument("--start", type=date)
+    command.add_argument("--finish", type=date)
+    command.add_argument("--format", choices=("csv", "jsonl"), help="default by file extension")
+    command = commands.add_parser("seed", help="generate synthetic sales history")
+    command.add_argument("start", type=date)
+    command.add_argument("finish", type=date, nargs="?", help="last day (default start)")
+    command.add_argument("--seed", type=int, default=0)
+    command.add_argument("--price", type=int, default=30)
+    command.add_argument("--demand", type=float, default=0.9)
+    command.add_argument("--halls", type=int, nargs="+", default=[1])
+    command.add_argument("--schedule", nargs="+", default=list(DEFAULT_SCHEDULE))
+    commands.add_parser("vacuum", help="checkpoint, compact and optimize the DB")
+    command = commands.add_parser("archive", help="move closed months to archive DBs")
+    command.add_argument("--month", nargs="+", type=parse_month,
+                         help="months YYYY-MM (default all closed)")
+    command.add_argument("--keep", type=int, default=1,
+                         help="closed months to keep in the working DB (default %(default)s)")
+    command = commands.add_parser("check", help="check the daily summary against tickets")
+    command.add_argument("--rebuild", action="store_true", help="rebuild the summary on mismatch")
+    args = parser.parse_args(argv)
+    if args.command in (None, "menu"):
+        admin_menu(args.db)
+        return 0
+    try:
+        result = run_command(args)
+    except (ValueError, OSError, sqlite3.Error) as err:
+        print(json.dumps({"error": "{0}: {1}".format(type(err).__name__, err)}), file=sys.stderr)
+        return 1
+    print(json.dumps(result, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    """
+    Если модуль запускается не из другого приложения, а как самостоятельная
+    программа - работаем в режиме администрирования: команда из командной
+    строки или интерактивное меню.
+    """
+    raise SystemExit(main())